@@ -0,0 +1,244 @@
+"""
+Cold-start benchmark of the generated scripts. A sample project is built
+with each bundled template version, then the time to the first response of
+the wsgi script and the time to exit of `bin/django check` and
+`bin/django help` are measured, along with the peak memory of the process.
+
+    python benchmarks/cold_start.py --repeat 20 -o results.json
+
+The templates target the Django version they are named after, the installed
+Django should match them. The runs with cold OS caches need the permission
+to write to /proc/sys/vm/drop_caches (Linux, as root), and are skipped
+otherwise
+"""
+
+import logging
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+# benchmark the checked-out code
+sys.path.insert(0, os.path.join(os.path.dirname(here), 'src'))
+
+import django
+
+from djangorecipe.recipe import Recipe
+import harness
+# after zc.buildout, which may provide its own copy
+import pkg_resources
+
+
+template_versions = sorted(os.listdir(os.path.join(
+    os.path.dirname(here), 'src', 'djangorecipe', 'templates')))
+
+# Loads the wsgi script and serves a single request
+first_response = """
+import runpy
+import sys
+import wsgiref.util
+
+application = runpy.run_path(sys.argv[1])['application']
+environ = {}
+wsgiref.util.setup_testing_defaults(environ)
+status = []
+response = application(environ, lambda s, headers, exc_info=None:
+                       status.append(s))
+try:
+    for chunk in response:
+        pass
+finally:
+    if hasattr(response, 'close'):
+        response.close()
+sys.stdout.write(status[0])
+"""
+
+
+class Buildout(dict):
+    # the recipe shares the working set on the buildout object
+    pass
+
+
+def build_project(root, version):
+    """
+    Generates the project and the scripts of the template version in the
+    directory, with the installed Django and the checked-out recipe
+    """
+    bin_dir = os.path.join(root, 'bin')
+    os.makedirs(bin_dir)
+    buildout = Buildout({
+        'buildout': {
+            'eggs-directory': os.path.join(root, 'eggs'),
+            'develop-eggs-directory': os.path.join(root, 'develop-eggs'),
+            'bin-directory': bin_dir,
+            'parts-directory': os.path.join(root, 'parts'),
+            'directory': root,
+            'python': 'buildout',
+            'executable': sys.executable,
+            'find-links': '',
+            'allow-hosts': '',
+            'offline': 'true'},
+        'versions': {'django': version}})
+    recipe = Recipe(buildout, 'django', {'recipe': 'djangorecipe',
+                                         'settings': 'settings',
+                                         'wsgi': 'true'})
+    working_set = pkg_resources.WorkingSet([])
+    working_set.add(pkg_resources.Distribution(
+        location=os.path.dirname(os.path.dirname(django.__file__)),
+        project_name='Django'))
+    working_set.add(pkg_resources.Distribution(
+        location=os.path.join(os.path.dirname(here), 'src'),
+        project_name='djangorecipe'))
+    recipe.egg.working_set = lambda requirements=(): (list(requirements),
+                                                      working_set)
+    recipe.install()
+    return (os.path.join(bin_dir, 'django'),
+            os.path.join(bin_dir, 'django.wsgi'))
+
+
+def drop_caches():
+    """
+    Drops the page cache of the OS, and returns whether it could
+    """
+    try:
+        subprocess.call(['sync'])
+        f = open('/proc/sys/vm/drop_caches', 'w')
+        try:
+            f.write('3\n')
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def run_process(argv):
+    """
+    Runs the process, and returns its duration, its peak memory in KB (or
+    None when it is not available) and its error output if it failed
+    """
+    devnull = open(os.devnull, 'wb')
+    errors = tempfile.TemporaryFile()
+    try:
+        start = time.time()
+        process = subprocess.Popen(argv, stdout=devnull, stderr=errors)
+        peak = None
+        if hasattr(os, 'wait4'):
+            # the resource usage of this process only
+            pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = int(not os.WIFEXITED(status) or
+                                     os.WEXITSTATUS(status) != 0)
+            peak = usage.ru_maxrss
+            if sys.platform == 'darwin':
+                peak = peak // 1024
+        else:
+            process.wait()
+        duration = time.time() - start
+        if process.returncode:
+            errors.seek(0)
+            output = errors.read().decode('utf-8', 'replace')
+            return duration, peak, output.strip() or \
+                'exit status %d' % process.returncode
+        return duration, peak, None
+    finally:
+        errors.close()
+        devnull.close()
+
+
+def measure(argv, repeat, cold):
+    """
+    Runs the process repeatedly and returns the summaries of its durations
+    and peak memory. Warm runs follow an unmeasured run, cold runs drop the
+    caches first
+    """
+    durations = []
+    peaks = []
+    failures = 0
+    error = None
+    if not cold:
+        run_process(argv)
+    for i in range(repeat):
+        if cold:
+            drop_caches()
+        duration, peak, error_output = run_process(argv)
+        if error_output:
+            failures += 1
+            error = error_output.splitlines()[-1]
+            continue
+        durations.append(duration)
+        if peak is not None:
+            peaks.append(peak)
+
+    results = {}
+    if durations:
+        results['time'] = harness.summarize(durations)
+        results['time']['failures'] = failures
+    else:
+        results['time'] = {'runs': 0, 'failures': failures, 'error': error}
+    if peaks:
+        results['maxrss'] = harness.summarize(peaks)
+    return results
+
+
+def run(options):
+    root = tempfile.mkdtemp('djangorecipe-bench')
+    cold_modes = [False]
+    if options.cold:
+        if drop_caches():
+            cold_modes.append(True)
+        else:
+            sys.stderr.write('The OS caches can not be dropped, the cold '
+                             'runs are skipped\n')
+    try:
+        results = {}
+        for version in options.versions:
+            control, wsgi = build_project(os.path.join(root, version),
+                                          version)
+            commands = [
+                ('wsgi', [sys.executable, '-c', first_response, wsgi]),
+                ('check', [sys.executable, control, 'check']),
+                ('help', [sys.executable, control, 'help'])]
+            for name, argv in commands:
+                for cold in cold_modes:
+                    key = '%s %s %s' % (version, name,
+                                        cold and 'cold' or 'warm')
+                    for kind, stats in measure(argv, options.repeat,
+                                               cold).items():
+                        results['%s %s' % (key, kind)] = stats
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--version', dest='versions', action='append',
+                      help='template version to benchmark, can be repeated '
+                      '(defaults to %s)' % ', '.join(template_versions))
+    parser.add_option('--repeat', type='int', default=10,
+                      help='number of runs of each measurement')
+    parser.add_option('--no-cold', dest='cold', action='store_false',
+                      default=True, help='skip the runs with cold caches')
+    parser.add_option('-o', '--output',
+                      help='file the JSON results are written to')
+    options, args = parser.parse_args(argv)
+    options.versions = options.versions or template_versions
+    unknown = set(options.versions) - set(template_versions)
+    if unknown:
+        parser.error('unknown template versions: %s'
+                     % ', '.join(sorted(unknown)))
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run(options)
+    parameters = {'versions': options.versions, 'repeat': options.repeat,
+                  'django': django.get_version()}
+    harness.write_results('cold_start', parameters, results, options.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
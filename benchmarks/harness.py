@@ -0,0 +1,137 @@
+"""
+Helpers shared by the benchmarks: repeated measurements, their summary, and
+the JSON results that are compared between commits.
+
+Comparing two result files::
+
+    python benchmarks/harness.py old.json new.json --threshold 0.1
+
+exits with status 1 when a median got slower by more than the threshold
+"""
+
+import json
+import optparse
+import platform
+import sys
+import time
+
+
+def percentile(samples, fraction):
+    """
+    Returns the percentile of the samples, interpolated between the closest
+    ranks
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * \
+        (position - lower)
+
+
+def summarize(samples):
+    """
+    Returns the statistics of the samples, rounded so that the results are
+    stable to diff
+    """
+    stats = {'runs': len(samples)}
+    for name, fraction in (('min', 0.0), ('median', 0.5), ('p90', 0.9),
+                           ('p99', 0.99), ('max', 1.0)):
+        stats[name] = round(percentile(samples, fraction), 6)
+    return stats
+
+
+def measure(function, repeat, setup=None):
+    """
+    Calls the function the given number of times and returns the summary of
+    the durations. The setup function, called before each run, is not timed
+    and its result is passed to the function
+    """
+    samples = []
+    for i in range(repeat):
+        args = ()
+        if setup is not None:
+            args = (setup(),)
+        start = time.time()
+        function(*args)
+        samples.append(time.time() - start)
+    return summarize(samples)
+
+
+def environment():
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': sys.platform}
+
+
+def write_results(name, parameters, results, path=None):
+    """
+    Writes the results of the benchmark as JSON, to the file if given or to
+    stdout
+    """
+    document = {'benchmark': name, 'environment': environment(),
+                'parameters': parameters, 'results': results}
+    content = json.dumps(document, indent=2, sort_keys=True) + '\n'
+    if path:
+        f = open(path, 'w')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+    else:
+        sys.stdout.write(content)
+
+
+def load_results(path):
+    f = open(path, 'r')
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def compare(old, new, threshold=0.1, key='median'):
+    """
+    Returns the (name, old value, new value, ratio) tuples of the results of
+    both runs, and the names of the results that regressed by more than the
+    threshold
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name].get(key)
+        after = new['results'][name].get(key)
+        if before is None or after is None:
+            # no successful run
+            continue
+        ratio = before and after / before or 1.0
+        rows.append((name, before, after, ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] OLD.json NEW.json')
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help='slowdown ratio reported as a regression')
+    parser.add_option('--key', default='median',
+                      help='statistic compared (min, median, p90, p99, max)')
+    options, args = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.error('two result files are needed')
+    old, new = [load_results(path) for path in args]
+    rows, regressions = compare(old, new, options.threshold, options.key)
+    width = max([len(row[0]) for row in rows] + [10])
+    for name, before, after, ratio in rows:
+        sys.stdout.write('%s  %12.6f %12.6f  %+6.1f%%%s\n' % (
+            name.ljust(width), before, after, (ratio - 1) * 100,
+            name in regressions and '  REGRESSION' or ''))
+    return regressions and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
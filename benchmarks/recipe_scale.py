@@ -0,0 +1,239 @@
+"""
+Benchmark of the recipe on synthetic buildouts: several djangorecipe parts,
+many stand-in eggs, a long extra-paths list, .pth files and a big project
+template. Runs offline, the working set is made of the generated eggs.
+
+    python benchmarks/recipe_scale.py --parts 5 --eggs 200 -o results.json
+"""
+
+import logging
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+here = os.path.dirname(os.path.abspath(__file__))
+# benchmark the checked-out code
+sys.path.insert(0, os.path.join(os.path.dirname(here), 'src'))
+
+from djangorecipe.recipe import Recipe
+from djangorecipe.templating import process_tree
+import harness
+# after zc.buildout, which may provide its own copy
+import pkg_resources
+
+
+class Buildout(dict):
+    # the recipe shares the working set on the buildout object
+    pass
+
+
+def write(path, content=''):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    f = open(path, 'w')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+
+
+class SyntheticBuildout(object):
+
+    def __init__(self, root, parts, eggs, extra_paths, pth_files, templates):
+        self.root = root
+        self.parts = parts
+        self.bin_dir = os.path.join(root, 'bin')
+        self.eggs_dir = os.path.join(root, 'eggs')
+        self.parts_dir = os.path.join(root, 'parts')
+        self.template_dir = os.path.join(root, 'templates')
+        os.makedirs(self.bin_dir)
+
+        self.eggs = []
+        for i in range(eggs):
+            location = os.path.join(self.eggs_dir, 'standin%d-1.0-py%d.%d.egg'
+                                    % ((i,) + sys.version_info[:2]))
+            write(os.path.join(location, 'standin%d' % i, '__init__.py'))
+            write(os.path.join(location, 'EGG-INFO', 'PKG-INFO'),
+                  'Metadata-Version: 1.0\nName: standin%d\nVersion: 1.0\n'
+                  % i)
+            self.eggs.append(location)
+
+        self.extra_paths = []
+        for i in range(extra_paths):
+            location = os.path.join(root, 'src', 'lib%d' % i)
+            write(os.path.join(location, 'lib%d' % i, '__init__.py'))
+            self.extra_paths.append(location)
+
+        self.pth_dirs = []
+        for i in range(pth_files):
+            site_dir = os.path.join(root, 'site%d' % i)
+            listed = []
+            for j in range(10):
+                write(os.path.join(site_dir, 'libs', 'lib%d' % j,
+                                   '__init__.py'))
+                listed.append(os.path.join('libs', 'lib%d' % j))
+            write(os.path.join(site_dir, 'libs.pth'),
+                  '# stand-in libraries\n' + '\n'.join(listed) +
+                  '\nimport os\nmissing\n')
+            self.pth_dirs.append(site_dir)
+
+        # a project template with the settings module and many packages
+        bench = os.path.join(self.template_dir, 'bench')
+        write(os.path.join(bench, '__init__.py'))
+        write(os.path.join(bench, 'development.py'),
+              "SECRET_KEY = '$secret'\nROOT_URLCONF = '${urlconf}'\n")
+        for i in range(templates):
+            package = os.path.join(bench, 'app%d' % (i // 20))
+            write(os.path.join(package, 'module%d.py' % i),
+                  '"""\n${project_name} module %d, $year-$month-$day\n"""\n'
+                  'VALUE = %d  # $$not replaced\n' % (i, i) * 20)
+
+        dists = [pkg_resources.Distribution.from_location(
+            location, os.path.basename(location)) for location in self.eggs]
+        dists.append(pkg_resources.Distribution(
+            location=os.path.join(os.path.dirname(here), 'src'),
+            project_name='djangorecipe'))
+        self.working_set = pkg_resources.WorkingSet([])
+        for dist in dists:
+            self.working_set.add(dist)
+
+    def buildout(self):
+        return Buildout({
+            'buildout': {
+                'eggs-directory': self.eggs_dir,
+                'develop-eggs-directory': os.path.join(self.root,
+                                                       'develop-eggs'),
+                'bin-directory': self.bin_dir,
+                'parts-directory': self.parts_dir,
+                'directory': self.root,
+                'python': 'buildout',
+                'executable': sys.executable,
+                'find-links': '',
+                'allow-hosts': '',
+                'offline': 'true'},
+            'djangorecipe': {'template-dirs': self.template_dir}})
+
+    def options(self, index):
+        return {'recipe': 'djangorecipe',
+                'project': 'project%d' % index,
+                'template': 'bench',
+                'control-script': 'django%d' % index,
+                'wsgi': 'true',
+                'eggs': ' '.join([os.path.basename(location).split('-')[0]
+                                  for location in self.eggs]),
+                'extra-paths': '\n'.join(self.extra_paths),
+                'pth-files': '\n'.join(self.pth_dirs)}
+
+    def recipes(self):
+        buildout = self.buildout()
+        recipes = []
+        for i in range(self.parts):
+            recipe = Recipe(buildout, 'django%d' % i, self.options(i))
+            # resolve to the stand-in eggs instead of an index
+            recipe.egg.working_set = \
+                lambda requirements=(), ws=self.working_set: (
+                    list(requirements), ws)
+            recipes.append(recipe)
+        return recipes
+
+    def clean(self):
+        for path in [self.parts_dir] + [
+                os.path.join(self.root, 'project%d' % i)
+                for i in range(self.parts)]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        for name in os.listdir(self.bin_dir):
+            os.remove(os.path.join(self.bin_dir, name))
+
+
+def run(options):
+    root = tempfile.mkdtemp('djangorecipe-bench')
+    try:
+        synthetic = SyntheticBuildout(
+            root, options.parts, options.eggs, options.extra_paths,
+            options.pth_files, options.templates)
+        repeat = options.repeat
+        results = {}
+
+        results['init'] = harness.measure(synthetic.recipes, repeat)
+
+        def fresh_recipes():
+            synthetic.clean()
+            return synthetic.recipes()
+
+        def install(recipes):
+            for recipe in recipes:
+                recipe.install()
+        results['install'] = harness.measure(install, repeat, fresh_recipes)
+
+        def installed_recipes():
+            recipes = fresh_recipes()
+            install(recipes)
+            return synthetic.recipes()
+
+        def update(recipes):
+            for recipe in recipes:
+                recipe.update()
+        results['update'] = harness.measure(update, repeat,
+                                            installed_recipes)
+
+        project_dir = os.path.join(root, 'project0')
+
+        def project_recipe():
+            if os.path.exists(project_dir):
+                shutil.rmtree(project_dir)
+            return synthetic.recipes()[0]
+        results['create_project'] = harness.measure(
+            lambda recipe: recipe.create_project(project_dir), repeat,
+            project_recipe)
+
+        mapping = synthetic.recipes()[0].get_template_vars()
+        tree = os.path.join(root, 'tree')
+
+        def copy_tree():
+            if os.path.exists(tree):
+                shutil.rmtree(tree)
+            shutil.copytree(os.path.join(synthetic.template_dir, 'bench'),
+                            tree)
+            return tree
+        results['process_tree'] = harness.measure(
+            lambda directory: process_tree(directory, mapping), repeat,
+            copy_tree)
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--parts', type='int', default=3,
+                      help='number of djangorecipe parts')
+    parser.add_option('--eggs', type='int', default=100,
+                      help='number of stand-in eggs')
+    parser.add_option('--extra-paths', type='int', default=100,
+                      help='number of extra-paths entries')
+    parser.add_option('--pth-files', type='int', default=5,
+                      help='number of directories with .pth files')
+    parser.add_option('--templates', type='int', default=500,
+                      help='number of files of the project template')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='number of runs of each measurement')
+    parser.add_option('-o', '--output',
+                      help='file the JSON results are written to')
+    options, args = parser.parse_args(argv)
+
+    # the recipe logs every .pth expansion
+    logging.basicConfig(level=logging.WARNING)
+    results = run(options)
+    parameters = dict([(name, getattr(options, name)) for name in (
+        'parts', 'eggs', 'extra_paths', 'pth_files', 'templates', 'repeat')])
+    harness.write_results('recipe_scale', parameters, results,
+                          options.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Throughput benchmark of the wsgi entry point. The application returned by
+djangorecipe.wsgi.main is called by many threads at once with a dummy view
+that prints to stdout and writes to stderr, with and without the `logfile`
+redirect, and the requests per second and the latencies are reported.
+
+    python benchmarks/wsgi_throughput.py --threads 16 --requests 5000
+"""
+
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wsgiref.util
+
+here = os.path.dirname(os.path.abspath(__file__))
+# benchmark the checked-out code
+sys.path.insert(0, os.path.join(os.path.dirname(here), 'src'))
+
+import harness
+
+
+settings_module = """
+SECRET_KEY = 'benchmark'
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+ROOT_URLCONF = 'bench_urls'
+INSTALLED_APPS = []
+MIDDLEWARE = []
+MIDDLEWARE_CLASSES = ()
+DATABASES = {}
+LOGGING_CONFIG = None
+"""
+
+urls_module = """
+import sys
+
+from django.http import HttpResponse
+
+try:
+    from django.urls import re_path as url
+except ImportError:
+    from django.conf.urls import url
+
+# lines the view prints and writes to stderr on each request
+writes = %d
+
+
+def view(request):
+    for i in range(writes):
+        print('handled %%s' %% request.path)
+        sys.stderr.write('warning for %%s\\n' %% request.path)
+    return HttpResponse('ok')
+
+urlpatterns = [url(r'^', view)]
+"""
+
+
+def drive(application, threads, requests):
+    """
+    Calls the application from the threads until the requests are served,
+    and returns the latencies and the total duration
+    """
+    latencies = []
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def work():
+        environ = {}
+        wsgiref.util.setup_testing_defaults(environ)
+        while True:
+            lock.acquire()
+            try:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            finally:
+                lock.release()
+            start = time.time()
+            response = application(dict(environ), start_response)
+            try:
+                for chunk in response:
+                    pass
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+            latencies.append(time.time() - start)
+
+    workers = [threading.Thread(target=work) for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, time.time() - start
+
+
+def run(options):
+    root = tempfile.mkdtemp('djangorecipe-bench')
+    stdout, stderr = sys.stdout, sys.stderr
+    devnull = open(os.devnull, 'w')
+    try:
+        for name, content in (('bench_settings.py', settings_module),
+                              ('bench_urls.py',
+                               urls_module % options.writes)):
+            f = open(os.path.join(root, name), 'w')
+            try:
+                f.write(content)
+            finally:
+                f.close()
+        sys.path.insert(0, root)
+        from djangorecipe import wsgi
+
+        results = {}
+        for mode, logfile in (('direct', None),
+                              ('logfile', os.path.join(root, 'wsgi.log'))):
+            # the output of the view is discarded when it is not redirected
+            sys.stdout = sys.stderr = devnull
+            try:
+                application = wsgi.main('bench_settings', logfile=logfile)
+                # not measured: loads the url configuration
+                drive(application, 1, 10)
+                latencies, duration = drive(application, options.threads,
+                                            options.requests)
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+            stats = harness.summarize(latencies)
+            stats['requests_per_second'] = round(len(latencies) / duration,
+                                                 1)
+            results['%s latency' % mode] = stats
+        return results
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        devnull.close()
+        shutil.rmtree(root)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--threads', type='int', default=16,
+                      help='number of concurrent threads')
+    parser.add_option('--requests', type='int', default=2000,
+                      help='number of requests of each mode')
+    parser.add_option('--writes', type='int', default=1,
+                      help='lines printed and written to stderr by the view '
+                      'on each request')
+    parser.add_option('-o', '--output',
+                      help='file the JSON results are written to')
+    options, args = parser.parse_args(argv)
+
+    results = run(options)
+    parameters = dict([(name, getattr(options, name))
+                       for name in ('threads', 'requests', 'writes')])
+    harness.write_results('wsgi_throughput', parameters, results,
+                          options.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
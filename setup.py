@@ -34,7 +34,7 @@ setup(name='djangorecipe',
       url='https://github.com/rvanlaar/djangorecipe',
       license='BSD',
       zip_safe=False,
-      package_data={'': ['templates/**/*.py']},
+      package_data={'': ['templates/**/*.py', 'named_templates/**/*.py']},
       install_requires=[
         'zc.buildout',
         'zc.recipe.egg',
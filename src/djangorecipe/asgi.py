@@ -0,0 +1,19 @@
+import os
+
+from djangorecipe.wsgi import redirect_output
+
+
+def main(settings_file, logfile=None, templates=None):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    if logfile:
+        redirect_output(logfile)
+
+    # Run ASGI handler for the application, available from Django 3.0
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+    if templates:
+        # Fill the cached template loader with the templates checked at
+        # build time
+        from djangorecipe.templates import warm_up
+        warm_up(templates)
+    return application
@@ -0,0 +1,205 @@
+"""
+Deployment bundles: the python path of the generated scripts packed in a
+single zip archive, with precompiled bytecode next to the sources so that
+zipimport does not compile them. The path entries holding native extensions
+are extracted once to a cache directory when the bundle is activated
+"""
+
+import hashlib
+import json
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import zipfile
+
+from djangorecipe.templating import load_json, make_dirs
+
+
+# Files that are left out of the bundles
+excluded_exts = ('.pyc', '.pyo')
+native_exts = ('.so', '.pyd', '.dylib')
+# Directories of metadata that are kept along the packages
+metadata_names = ('EGG-INFO',)
+metadata_exts = ('.egg-info', '.dist-info')
+
+
+def is_system_path(entry):
+    """
+    Returns whether the path entry belongs to the python installation, which
+    is expected on the hosts the bundle is deployed to
+    """
+    entry = os.path.realpath(entry)
+    for prefix in set([sys.prefix, sys.exec_prefix,
+                       getattr(sys, 'base_prefix', sys.prefix)]):
+        prefix = os.path.realpath(prefix)
+        if entry == prefix or entry.startswith(prefix + os.path.sep):
+            return True
+    return False
+
+
+def entry_files(entry):
+    """
+    Returns the (relative path, path) pairs of the files of the top-level
+    modules and packages of the path entry, with their metadata
+    """
+    files = []
+    if not os.path.isdir(entry):
+        return files
+    for name in sorted(os.listdir(entry)):
+        path = os.path.join(entry, name)
+        base, ext = os.path.splitext(name)
+        if os.path.isfile(path):
+            if ext == '.py' or ext in native_exts:
+                files.append((name, path))
+            continue
+        if not (os.path.exists(os.path.join(path, '__init__.py')) or
+                name in metadata_names or ext in metadata_exts):
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted([d for d in dirnames if d != '__pycache__'])
+            for filename in sorted(filenames):
+                if not filename.endswith(excluded_exts):
+                    file_path = os.path.join(dirpath, filename)
+                    files.append((os.path.relpath(file_path, entry),
+                                  file_path))
+    return files
+
+
+def bundle_key(path, files):
+    """
+    Returns a hash of the files of the path entries and of the generated
+    entry points
+    """
+    key = hashlib.md5()
+    for entry in path:
+        key.update(entry.encode('utf-8'))
+        for rel_path, file_path in entry_files(entry):
+            stat = os.stat(file_path)
+            key.update(('%s %s %s' % (rel_path, stat.st_size,
+                                      stat.st_mtime)).encode('utf-8'))
+    for name, content in files:
+        key.update(name.encode('utf-8'))
+        key.update(content.encode('utf-8'))
+    return key.hexdigest()
+
+
+def compiled(file_path, rel_path):
+    """
+    Returns the bytecode of the module in the legacy .pyc format zipimport
+    looks for, or None if it does not compile
+    """
+    handle, cfile = tempfile.mkstemp('.pyc')
+    os.close(handle)
+    try:
+        try:
+            py_compile.compile(file_path, cfile, rel_path, doraise=True)
+        except py_compile.PyCompileError:
+            return None
+        f = open(cfile, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+    finally:
+        os.remove(cfile)
+
+
+def build(archive, path, files):
+    """
+    Writes the bundle of the path entries, each in its own lib/<index>
+    directory so that the order of the path is kept, along with the given
+    (name, content) files. The bundle is only rebuilt when the files change.
+    Returns whether it was rebuilt
+    """
+    key = bundle_key(path, files)
+    manifest = load_json(archive, member='bundle.json')
+    if manifest is not None and manifest.get('key') == key:
+        return False
+
+    directory = os.path.dirname(archive)
+    make_dirs(directory)
+    handle, tmp_path = tempfile.mkstemp('.pyz', dir=directory)
+    native = []
+    f = os.fdopen(handle, 'wb')
+    try:
+        try:
+            f.write(('#!/usr/bin/env %s\n'
+                     % os.path.basename(sys.executable)).encode('utf-8'))
+            write_bundle(f, path, files, key, native)
+        finally:
+            f.close()
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    os.chmod(tmp_path, int('755', 8))
+    if os.path.exists(archive):
+        os.remove(archive)
+    os.rename(tmp_path, archive)
+    return True
+
+
+def write_bundle(f, path, files, key, native):
+    bundle = zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED)
+    try:
+        for index, entry in enumerate(path):
+            prefix = 'lib/%d/' % index
+            for rel_path, file_path in entry_files(entry):
+                arcname = prefix + rel_path.replace(os.path.sep, '/')
+                bundle.write(file_path, arcname)
+                if rel_path.endswith(native_exts):
+                    if index not in native:
+                        native.append(index)
+                elif rel_path.endswith('.py'):
+                    code = compiled(file_path, rel_path)
+                    if code is not None:
+                        bundle.writestr(arcname + 'c', code)
+        for name, content in files:
+            bundle.writestr(name, content)
+        bundle.writestr('bundle.json', json.dumps(
+            {'key': key, 'native': native}, sort_keys=True))
+    finally:
+        bundle.close()
+
+
+def cache_root():
+    return os.environ.get('DJANGORECIPE_BUNDLE_CACHE') or \
+        os.path.join(os.path.expanduser('~'), '.cache', 'djangorecipe')
+
+
+def activate(archive, cache_dir=None):
+    """
+    Replaces the path entries of the bundle holding native extensions by
+    their copy in the cache directory, extracting them the first time
+    """
+    manifest = load_json(archive, member='bundle.json')
+    if not manifest or not manifest['native']:
+        return []
+    cache_dir = cache_dir or cache_root()
+    target = os.path.join(cache_dir, manifest['key'])
+    if not os.path.exists(target):
+        make_dirs(cache_dir)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        prefixes = tuple(['lib/%d/' % index for index in manifest['native']])
+        bundle = zipfile.ZipFile(archive)
+        try:
+            bundle.extractall(tmp_dir, [name for name in bundle.namelist()
+                                        if name.startswith(prefixes)])
+        finally:
+            bundle.close()
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # extracted by another process in the meantime
+            shutil.rmtree(tmp_dir)
+
+    extracted = []
+    for index in manifest['native']:
+        bundled = os.path.join(archive, 'lib', str(index))
+        path = os.path.join(target, 'lib', str(index))
+        if bundled in sys.path:
+            sys.path[sys.path.index(bundled)] = path
+            extracted.append(path)
+    return extracted
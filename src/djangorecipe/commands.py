@@ -0,0 +1,83 @@
+"""
+Index of the management commands of a project, built at buildout time so that
+the control script does not scan every installed application on each run
+"""
+
+import json
+import os
+
+from djangorecipe.templating import load_json
+
+
+# Arguments that only list commands
+help_commands = ('help', '--help', '-h', 'version', '--version')
+
+
+def build_index(settings_file, index_path, key):
+    """
+    Writes the command name to application mapping discovered by Django to
+    the index file
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    from django.conf import settings
+    from django.core import management
+
+    commands = {}
+    for name, app_name in management.get_commands().items():
+        # commands registered as instances can not be indexed
+        if isinstance(app_name, str):
+            commands[name] = app_name
+
+    index_file = open(index_path, 'w')
+    try:
+        json.dump({'key': key,
+                   'apps': list(settings.INSTALLED_APPS),
+                   'commands': commands}, index_file, indent=2, sort_keys=True)
+    finally:
+        index_file.close()
+    return 0
+
+
+def use_index(index_path, argv):
+    """
+    Makes Django dispatch commands from the index instead of scanning the
+    installed applications. Django's own discovery is kept when the index is
+    missing, when the installed applications changed since it was built or
+    when the requested command is not in it
+    """
+    index = load_json(index_path)
+    if index is None:
+        return False
+    commands = index['commands']
+
+    subcommand = len(argv) > 1 and argv[1] or 'help'
+    if subcommand not in commands and subcommand not in help_commands:
+        return False
+
+    from django.conf import settings
+    try:
+        installed_apps = list(settings.INSTALLED_APPS)
+    except Exception:
+        # let Django report the settings errors
+        return False
+    if installed_apps != index['apps']:
+        return False
+
+    from django.core import management
+    original = management.get_commands
+
+    def get_commands():
+        return dict(commands)
+
+    def cache_clear():
+        # the installed applications changed, go back to Django's discovery
+        management.get_commands = original
+        if hasattr(original, 'cache_clear'):
+            original.cache_clear()
+
+    get_commands.cache_clear = cache_clear
+    management.get_commands = get_commands
+    return True
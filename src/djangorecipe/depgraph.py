@@ -0,0 +1,185 @@
+"""
+Import dependency graph of the project modules, used by the test runner to
+select the tests affected by a change. The graph is cached and only the
+modules that changed since the last run are parsed again
+"""
+
+import ast
+import json
+import os
+import subprocess
+
+from djangorecipe.templating import load_json
+
+
+def module_files(roots):
+    """
+    Lists the python modules found in the given directories. Only the
+    top-level modules and packages of each directory are explored. Returns a
+    list of (module name, path) tuples
+    """
+    modules = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            if rel_dir == os.curdir:
+                package = []
+            else:
+                if not os.path.exists(os.path.join(dirpath, '__init__.py')):
+                    dirnames[:] = []
+                    continue
+                package = rel_dir.split(os.path.sep)
+            dirnames[:] = sorted([d for d in dirnames if '.' not in d])
+            for f in sorted(filenames):
+                name, ext = os.path.splitext(f)
+                if ext != '.py':
+                    continue
+                if name == '__init__':
+                    if not package:
+                        continue
+                    module = package
+                else:
+                    module = package + [name]
+                modules.append(('.'.join(module), os.path.join(dirpath, f)))
+    return modules
+
+
+def imports_of(path, module):
+    """
+    Returns the names of the modules imported by the module stored in the
+    file. The names imported from a module are also listed, as they may be
+    submodules
+    """
+    source = open(path, 'rb')
+    try:
+        tree = ast.parse(source.read(), path)
+    except SyntaxError:
+        return []
+    finally:
+        source.close()
+
+    if os.path.basename(path) == '__init__.py':
+        package = module.split('.')
+    else:
+        package = module.split('.')[:-1]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.add(alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1]
+                if node.module:
+                    base = base + node.module.split('.')
+            else:
+                base = node.module.split('.')
+            if base:
+                names.add('.'.join(base))
+            for alias in node.names:
+                if alias.name != '*':
+                    names.add('.'.join(base + [alias.name]))
+    return sorted(names)
+
+
+def update_graph(roots, cache_path):
+    """
+    Returns the import graph of the modules found in the given directories,
+    as a {path: {'module', 'mtime', 'imports'}} dictionary. Only the modules
+    that changed since the graph was cached are parsed
+    """
+    graph = load_json(cache_path, {})
+
+    updated = {}
+    changed = False
+    for module, path in module_files(roots):
+        mtime = os.path.getmtime(path)
+        entry = graph.get(path)
+        if not entry or entry['mtime'] != mtime or entry['module'] != module:
+            entry = {'module': module, 'mtime': mtime,
+                     'imports': imports_of(path, module)}
+            changed = True
+        updated[path] = entry
+
+    if changed or len(updated) != len(graph):
+        cache_file = open(cache_path, 'w')
+        try:
+            json.dump(updated, cache_file)
+        finally:
+            cache_file.close()
+    return updated
+
+
+def affected_modules(graph, changed_paths):
+    """
+    Returns the names of the modules that are changed or that import a
+    changed module, directly or not
+    """
+    modules = dict([(entry['module'], path)
+                    for path, entry in graph.items()])
+    dependents = {}
+    for path, entry in graph.items():
+        for name in entry['imports']:
+            # resolve the name to the closest known module
+            parts = name.split('.')
+            while parts and '.'.join(parts) not in modules:
+                parts.pop()
+            if parts:
+                dependents.setdefault('.'.join(parts), set()).add(
+                    entry['module'])
+
+    real_paths = dict([(os.path.realpath(path), path) for path in graph])
+    affected = set()
+    for path in changed_paths:
+        path = real_paths.get(os.path.realpath(path))
+        if path:
+            affected.add(graph[path]['module'])
+    pending = list(affected)
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent not in affected:
+                affected.add(dependent)
+                pending.append(dependent)
+    return affected
+
+
+def is_test_module(module):
+    parts = module.split('.')
+    return parts[-1].startswith('test') or 'tests' in parts[:-1]
+
+
+def affected_tests(graph, changed_paths, apps):
+    """
+    Returns the test modules of the apps affected by the changed files
+    """
+    modules = [m for m in affected_modules(graph, changed_paths)
+               if is_test_module(m) and
+               [app for app in apps if m == app or m.startswith(app + '.')]]
+    # packages already run their submodules
+    return sorted([m for m in modules
+                   if not [p for p in modules if m.startswith(p + '.')]])
+
+
+def git_changes(ref, directory):
+    """
+    Returns the absolute paths of the files that differ from the git
+    reference, including the untracked ones
+    """
+    top = subprocess.Popen(['git', 'rev-parse', '--show-toplevel'],
+                           cwd=directory, stdout=subprocess.PIPE)
+    top_dir = top.communicate()[0].decode('utf-8').strip()
+    if top.returncode:
+        raise OSError('%s is not in a git repository' % directory)
+    paths = []
+    for command in (['git', 'diff', '--name-only', ref],
+                    ['git', 'ls-files', '--others', '--exclude-standard']):
+        process = subprocess.Popen(command, cwd=top_dir,
+                                   stdout=subprocess.PIPE)
+        output = process.communicate()[0].decode('utf-8')
+        if process.returncode:
+            raise OSError('%s failed' % ' '.join(command))
+        paths.extend([os.path.join(top_dir, p)
+                      for p in output.splitlines() if p])
+    return paths
@@ -0,0 +1,158 @@
+"""
+Import time tracer for the generated scripts. A finder placed first on
+sys.meta_path times the execution of every module, and a tree of the
+cumulative import times is written when the process exits, along with the
+sys.path entry each module was loaded from
+"""
+
+import atexit
+import os
+import sys
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Node(object):
+
+    def __init__(self, name, entry=None):
+        self.name = name
+        self.entry = entry
+        self.cumulative = 0.0
+        self.children = []
+
+    @property
+    def own(self):
+        return self.cumulative - sum([c.cumulative for c in self.children])
+
+
+def path_entry(origin, path):
+    """
+    Returns the sys.path entry the file was found in
+    """
+    if not origin or not os.path.isabs(origin):
+        # built-in and frozen modules
+        return origin or ''
+    best = ''
+    for entry in path:
+        entry = os.path.abspath(entry or os.curdir)
+        if origin.startswith(entry + os.path.sep) and len(entry) > len(best):
+            best = entry
+    return best
+
+
+class ImportTracer(object):
+    """
+    Finder delegating to the other finders, and timing the execution of the
+    modules they find
+    """
+
+    def __init__(self):
+        self.root = Node(None)
+        self.stack = [self.root]
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is None or not hasattr(loader, 'exec_module'):
+            return spec
+        spec.loader = TimedLoader(self, loader, Node(
+            fullname, path_entry(spec.origin, sys.path)))
+        return spec
+
+    def enter(self, node):
+        self.stack[-1].children.append(node)
+        self.stack.append(node)
+
+    def leave(self, node, duration):
+        node.cumulative = duration
+        self.stack.pop()
+
+    def summary(self):
+        """
+        Returns the own import time of the modules of each sys.path entry
+        """
+        totals = {}
+        pending = list(self.root.children)
+        while pending:
+            node = pending.pop()
+            totals[node.entry] = totals.get(node.entry, 0.0) + node.own
+            pending.extend(node.children)
+        return sorted(totals.items(), key=lambda t: t[1], reverse=True)
+
+    def lines(self, node=None, depth=0):
+        node = node or self.root
+        lines = []
+        for child in sorted(node.children, key=lambda c: c.cumulative,
+                            reverse=True):
+            lines.append('%10.2f %10.2f  %s%s  (%s)' % (
+                child.cumulative * 1000, child.own * 1000, '  ' * depth,
+                child.name, child.entry))
+            lines.extend(self.lines(child, depth + 1))
+        return lines
+
+    def write(self, report_path):
+        report = open(report_path, 'w')
+        try:
+            report.write('Import time per sys.path entry (ms)\n')
+            for entry, duration in self.summary():
+                report.write('%10.2f  %s\n' % (duration * 1000, entry))
+            report.write('\nCumulative and own import time (ms)\n')
+            for line in self.lines():
+                report.write(line + '\n')
+        finally:
+            report.close()
+
+
+class TimedLoader(object):
+    """
+    Wraps the loader of a module to time its execution
+    """
+
+    def __init__(self, tracer, loader, node):
+        self.tracer = tracer
+        self.loader = loader
+        self.node = node
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        if hasattr(self.loader, 'create_module'):
+            return self.loader.create_module(spec)
+        return None
+
+    def exec_module(self, module):
+        # give the module its real loader back
+        module.__loader__ = self.loader
+        if getattr(module, '__spec__', None) is not None:
+            module.__spec__.loader = self.loader
+        self.tracer.enter(self.node)
+        start = timer()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.tracer.leave(self.node, timer() - start)
+
+
+def start(report_path):
+    """
+    Traces the imports until the process exits, and then writes the report
+    """
+    if sys.version_info < (3, 4):
+        # the tracer relies on module specs
+        return None
+    tracer = ImportTracer()
+    sys.meta_path.insert(0, tracer)
+    report_dir = os.path.dirname(report_path)
+    if report_dir and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    atexit.register(tracer.write, report_path)
+    return tracer
@@ -4,6 +4,29 @@ import sys
 from django.core import management
 
 
-def main(settings_file):
+def main(settings_file, command_index=None, profile=None,
+         path_profile=None):
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    if path_profile and '--path-profile' in sys.argv[1:]:
+        # record the path entries of the modules loaded by the command
+        import atexit
+        from djangorecipe import pathorder
+        sys.argv.remove('--path-profile')
+        atexit.register(pathorder.record, path_profile)
+    if '--profile' in sys.argv[1:]:
+        sys.argv.remove('--profile')
+        profile = profile or os.getcwd()
+    elif os.environ.get('DJANGORECIPE_PROFILE'):
+        profile = profile or os.getcwd()
+    # the subcommand is looked up once the flags are removed
+    if command_index:
+        from djangorecipe.commands import use_index
+        use_index(command_index, sys.argv)
+
+    if profile:
+        from djangorecipe import profiling
+        argv = list(sys.argv)
+        return profiling.profile(
+            lambda: management.execute_from_command_line(argv), argv,
+            profile)
     management.execute_from_command_line(sys.argv)
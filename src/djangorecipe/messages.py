@@ -0,0 +1,71 @@
+"""
+Incremental compilation of the message catalogs at buildout time. Only the
+.po files newer than their .mo file are compiled, by msgfmt processes run in
+parallel
+"""
+
+import os
+import subprocess
+import time
+
+from djangorecipe.static import run_pool
+
+
+def find_catalogs(roots, excluded=()):
+    """
+    Returns the (po, mo) paths of the catalogs of the locale directories
+    found under the roots, whose .mo file is missing or older than the .po
+    file
+    """
+    excluded = set([os.path.abspath(path) for path in excluded])
+    catalogs = []
+    seen = set()
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted([
+                d for d in dirnames if not d.startswith('.') and
+                os.path.abspath(os.path.join(dirpath, d)) not in excluded])
+            if os.path.basename(dirpath) != 'LC_MESSAGES':
+                continue
+            for filename in sorted(filenames):
+                if not filename.endswith('.po'):
+                    continue
+                po = os.path.join(dirpath, filename)
+                if os.path.realpath(po) in seen:
+                    continue
+                seen.add(os.path.realpath(po))
+                mo = po[:-3] + '.mo'
+                if not os.path.exists(mo) or \
+                        os.path.getmtime(mo) < os.path.getmtime(po):
+                    catalogs.append((po, mo))
+    return catalogs
+
+
+def compile_catalog(catalog):
+    """
+    Compiles the catalog with msgfmt, and returns its duration and the error
+    output of msgfmt if it failed
+    """
+    po, mo = catalog
+    start = time.time()
+    try:
+        process = subprocess.Popen(
+            ['msgfmt', '--check-format', '-o', mo, po],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        return time.time() - start, 'Could not run msgfmt: %s' % e
+    output, errors = process.communicate()
+    if process.returncode:
+        return time.time() - start, errors.decode('utf-8', 'replace')
+    return time.time() - start, None
+
+
+def compile_messages(roots, excluded=(), workers=4):
+    """
+    Compiles the outdated catalogs found under the roots, and returns a list
+    of (po path, duration, error) tuples
+    """
+    catalogs = find_catalogs(roots, excluded)
+    results = run_pool(compile_catalog, catalogs, workers)
+    return [(po, duration, error)
+            for (po, mo), (duration, error) in zip(catalogs, results)]
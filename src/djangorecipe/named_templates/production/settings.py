@@ -0,0 +1,115 @@
+"""
+Django settings for ${project_name} project, tuned for production throughput.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/1.6/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/1.6/ref/settings/
+"""
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+import os
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+
+# Deployment checklist
+# See https://docs.djangoproject.com/en/1.6/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = '${secret}'
+
+DEBUG = False
+
+TEMPLATE_DEBUG = False
+
+# Required when DEBUG is False: add the host names the site is served from.
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+)
+
+MIDDLEWARE_CLASSES = (
+    # Answers conditional GET requests with 304 Not Modified, using the ETag
+    # computed by CommonMiddleware
+    'django.middleware.http.ConditionalGetMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+)
+
+USE_ETAGS = True
+
+ROOT_URLCONF = '${project_name}.urls'
+
+WSGI_APPLICATION = '${project_name}.wsgi.application'
+
+
+# Templates are parsed once per process and kept in memory
+
+TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', (
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    )),
+)
+
+
+# Database
+# https://docs.djangoproject.com/en/1.6/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests (in seconds)
+        'CONN_MAX_AGE': ${conn_max_age},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.6/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': '${cache_backend}',
+        'LOCATION': '${cache_location}',
+        'TIMEOUT': ${cache_timeout},
+    }
+}
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/1.6/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/1.6/howto/static-files/
+
+STATIC_URL = '/static/'
@@ -0,0 +1,106 @@
+"""
+Usage-driven order of the python path of the generated scripts. The control
+script records the path entries the loaded modules come from, and the recipe
+puts the most used entries first, as long as the module found for every name
+stays the same
+"""
+
+import json
+import os
+import sys
+import zipfile
+
+from djangorecipe.importtrace import path_entry
+from djangorecipe.templating import load_json, make_dirs
+
+
+def record(profile_path):
+    """
+    Adds the path entries of the loaded modules to the usage recorded in the
+    file
+    """
+    usage = load_json(profile_path) or {}
+    path = [p for p in sys.path if p]
+    for name, module in list(sys.modules.items()):
+        origin = getattr(module, '__file__', None)
+        if not origin:
+            continue
+        entry = path_entry(os.path.abspath(origin), path)
+        if entry:
+            modules = usage.setdefault(entry, [])
+            if name not in modules:
+                modules.append(name)
+    profile_dir = os.path.dirname(profile_path)
+    if profile_dir:
+        make_dirs(profile_dir)
+    profile = open(profile_path, 'w')
+    try:
+        json.dump(usage, profile, indent=2, sort_keys=True)
+    finally:
+        profile.close()
+
+
+def provided_names(entry):
+    """
+    Returns the top-level module and package names the path entry provides
+    """
+    names = set()
+    if os.path.isdir(entry):
+        candidates = os.listdir(entry)
+    elif zipfile.is_zipfile(entry):
+        archive = zipfile.ZipFile(entry)
+        try:
+            candidates = set([n.split('/')[0] for n in archive.namelist()])
+        finally:
+            archive.close()
+    else:
+        return names
+    for name in candidates:
+        base, ext = os.path.splitext(name)
+        if ext in ('.py', '.pyc', '.so', '.pyd'):
+            names.add(base.split('.')[0])
+        elif not ext and not name.startswith('.'):
+            # packages, including the namespace packages
+            names.add(name)
+    return names
+
+
+def winners(path, names_of):
+    """
+    Returns the path entry each name is imported from
+    """
+    found = {}
+    for entry in path:
+        for name in names_of[entry]:
+            found.setdefault(name, entry)
+    return found
+
+
+def reorder(path, usage):
+    """
+    Returns the path with the most used entries first. The entries providing
+    the same name keep their relative order, so that the same module wins
+    """
+    names_of = dict([(entry, provided_names(entry)) for entry in path])
+    # entries that must stay before each entry
+    before = dict([(entry, set()) for entry in path])
+    for i, entry in enumerate(path):
+        for other in path[i + 1:]:
+            if names_of[entry] & names_of[other]:
+                before[other].add(entry)
+
+    def score(entry):
+        return (-len(usage.get(entry, ())), path.index(entry))
+
+    ordered = []
+    pending = list(path)
+    while pending:
+        ready = [entry for entry in pending
+                 if not before[entry] - set(ordered)]
+        entry = min(ready, key=score)
+        ordered.append(entry)
+        pending.remove(entry)
+
+    if winners(ordered, names_of) != winners(path, names_of):
+        return list(path)
+    return ordered
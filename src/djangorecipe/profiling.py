@@ -0,0 +1,50 @@
+"""
+Profiling of the management commands run through the control script
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+from djangorecipe.queries import QueryCounter
+from djangorecipe.templating import make_dirs
+
+
+# Number of functions listed in the summary
+summary_size = 25
+
+
+def profile_path(directory, argv):
+    """
+    Returns the path of the stats file of the command
+    """
+    command = len(argv) > 1 and argv[1] or 'help'
+    return os.path.join(directory, '%s-%s.pstats' % (
+        command.replace(os.path.sep, '_'), time.strftime('%Y%m%d-%H%M%S')))
+
+
+def profile(run, argv, directory, stream=None):
+    """
+    Runs the command under cProfile, then dumps the stats to the directory
+    and writes a summary of the slowest functions and of the SQL queries
+    """
+    stream = stream or sys.stderr
+    make_dirs(directory)
+    counter = QueryCounter()
+    counter.install()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(run)
+    finally:
+        counter.uninstall()
+        path = profile_path(directory, argv)
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(summary_size)
+        for alias in sorted(counter.stats):
+            count, duration = counter.stats[alias]
+            stream.write('%s: %d queries in %.3fs\n'
+                         % (alias, count, duration))
+        stream.write('Profile written to %s\n' % path)
@@ -0,0 +1,76 @@
+"""
+Expansion of the .pth files of a directory without the site module: the
+import lines are not executed, sys.path is left untouched and the directories
+that do not exist are dropped
+"""
+
+import os
+
+
+# Expanded directories, with the modification times of their .pth files
+cache = {}
+
+
+def pth_files(sitedir):
+    """
+    Returns the paths of the .pth files of the directory, in the order the
+    site module processes them
+    """
+    try:
+        names = os.listdir(sitedir)
+    except OSError:
+        return []
+    return [os.path.join(sitedir, name) for name in sorted(names)
+            if name.endswith('.pth')]
+
+
+def parse(pth_file):
+    """
+    Returns the directories listed in the .pth file, made absolute against
+    the directory of the file
+    """
+    sitedir = os.path.dirname(pth_file)
+    paths = []
+    f = open(pth_file, 'r')
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith(('import ', 'import\t')):
+                # executed by the site module only
+                continue
+            paths.append(os.path.normpath(os.path.join(sitedir, line)))
+    finally:
+        f.close()
+    return paths
+
+
+def expand(sitedir):
+    """
+    Returns the directory followed by the existing directories listed in its
+    .pth files, without duplicates. The result is cached until one of the
+    .pth files changes
+    """
+    sitedir = os.path.abspath(sitedir)
+    files = pth_files(sitedir)
+    key = []
+    for pth_file in files:
+        try:
+            key.append((pth_file, os.path.getmtime(pth_file)))
+        except OSError:
+            pass
+    cached = cache.get(sitedir)
+    if cached is None or cached[0] != key:
+        listed = []
+        for pth_file, mtime in key:
+            listed.extend(parse(pth_file))
+        cached = cache[sitedir] = (key, listed)
+
+    paths = []
+    if files:
+        paths.append(sitedir)
+    for path in cached[1]:
+        if path not in paths and os.path.isdir(path):
+            paths.append(path)
+    return paths
@@ -0,0 +1,86 @@
+"""
+Counting of the SQL queries run by Django, per database alias, without
+enabling DEBUG
+"""
+
+import time
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class QueryCounter(object):
+    """
+    Counts the queries and the time spent running them, per database alias.
+    The cursors of every connection are instrumented once installed
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.originals = None
+
+    def record(self, alias, duration, count=1):
+        stats = self.stats.setdefault(alias, [0, 0.0])
+        stats[0] += count
+        stats[1] += duration
+
+    def totals(self):
+        """
+        Returns the number of queries and their total time, for all aliases
+        """
+        return (sum([s[0] for s in self.stats.values()]),
+                sum([s[1] for s in self.stats.values()]))
+
+    def install(self):
+        if self.originals is not None:
+            return
+        wrapper = cursor_wrapper()
+        self.originals = (wrapper.__dict__.get('execute'),
+                          wrapper.__dict__.get('executemany'))
+        execute = self.originals[0] or forwarded('execute')
+        executemany = self.originals[1] or forwarded('executemany')
+        counter = self
+
+        def counted_execute(self, sql, params=None):
+            start = timer()
+            try:
+                return execute(self, sql, params)
+            finally:
+                counter.record(self.db.alias, timer() - start)
+
+        def counted_executemany(self, sql, param_list):
+            start = timer()
+            try:
+                return executemany(self, sql, param_list)
+            finally:
+                counter.record(self.db.alias, timer() - start)
+
+        wrapper.execute = counted_execute
+        wrapper.executemany = counted_executemany
+
+    def uninstall(self):
+        if self.originals is None:
+            return
+        wrapper = cursor_wrapper()
+        for name, original in zip(('execute', 'executemany'),
+                                  self.originals):
+            if original is None:
+                delattr(wrapper, name)
+            else:
+                setattr(wrapper, name, original)
+        self.originals = None
+
+
+def cursor_wrapper():
+    try:
+        from django.db.backends.utils import CursorWrapper
+    except ImportError:
+        # Django < 1.7
+        from django.db.backends.util import CursorWrapper
+    return CursorWrapper
+
+
+def forwarded(name):
+    # The cursor wrapper of Django < 1.6 forwards the method to the cursor
+    def method(self, *args):
+        return self.__getattr__(name)(*args)
+    return method
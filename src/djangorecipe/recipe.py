@@ -1,16 +1,29 @@
 from random import choice
+import difflib
+import hashlib
+import json
 import os
 import logging
 import re
 import sys
 import shutil
+import subprocess
+import time
 from datetime import date
 from distutils.version import StrictVersion
 
 from zc.buildout import UserError
+import zc.buildout.easy_install
 import zc.recipe.egg
+try:
+    from zc.buildout.utils import get_pth_paths
+except ImportError:
+    get_pth_paths = None
 
-from djangorecipe.templating import process, process_tree, script_template
+from djangorecipe import bundle, messages, pathorder, pth
+from djangorecipe.templating import bundle_template, checksum, load_json, \
+    make_dirs, process, process_tree, render, render_name, render_tree, \
+    script_template, task_template, template_files
 
 
 class Recipe(object):
@@ -53,92 +66,653 @@ class Recipe(object):
         options.setdefault('wsgilog', '')
         options.setdefault('logfile', '')
 
-    def install(self):
-        base_dir = self.buildout['buildout']['directory']
-
-        if self.root_pkg:
-            project_dir = os.path.join(base_dir, self.options['project'])
-        else:
-            project_dir = base_dir
+        # set when the settings module is frozen in a snapshot
+        self.snapshot_module = None
+        # set when the management commands are indexed
+        self.command_index = None
+        # set while the scripts of an additional settings module are created
+        self.settings = None
+        # duration of the phases of the install or update
+        self.timings = []
 
-        extra_paths = self.get_extra_paths()
-        requirements, ws = self.egg.working_set(['djangorecipe'])
-
-        script_paths = []
-        # Create the Django management script
-        script_paths.extend(self.create_manage_script(extra_paths, ws))
-
-        # Create the test runner
-        script_paths.extend(self.create_test_runner(extra_paths, ws))
+    def install(self):
+        self.timings = []
+        project_dir = self.get_project_dir()
 
-        # Make the wsgi and fastcgi scripts if enabled
-        script_paths.extend(self.make_scripts(extra_paths, ws))
+        extra_paths = self.timed('extra-paths', self.get_extra_paths)
+        requirements, ws = self.timed('working-set', self.get_working_set)
 
         # Create default project files if we haven't got a project
         # egg specified, and if the settings don't already exist
         if not self.options.get('projectegg'):
             settings_path = \
-                os.path.join(project_dir, *self.options['settings'].split('.'))
-            if not (os.path.exists(settings_path + '.py')):
-                self.create_project(project_dir)
+                os.path.join(project_dir, *self.get_settings().split('.'))
+            if self.is_enabled('dry-run'):
+                # only report what the template would generate
+                self.timed('project', self.preview_project, project_dir)
+            elif not (os.path.exists(settings_path + '.py')):
+                self.timed('project', self.create_project, project_dir)
             else:
                 self.log.debug(
                     'Skipping creating project files for %(project)s since '
                     'its main settings module exists' % self.options)
+                self.timed('project', self.upgrade_project, project_dir)
+
+        # Compile the message catalogs if requested
+        if self.is_enabled('compilemessages'):
+            self.timed('compilemessages', self.compile_messages, extra_paths)
+
+        paths = self.create_scripts(extra_paths, ws)
+        return paths + self.report_timings()
+
+    def get_working_set(self):
+        # sibling djangorecipe parts with the same eggs share the resolved
+        # working set during the buildout run
+        buildout = self.buildout['buildout']
+        key = (tuple(self.options.get('eggs', '').split()),
+               buildout.get('eggs-directory'),
+               buildout.get('develop-eggs-directory'),
+               self.options.get('find-links', buildout.get('find-links')),
+               self.options.get('index', buildout.get('index')),
+               buildout.get('offline'), buildout.get('newest'))
+        cache = getattr(self.buildout, '_djangorecipe_working_sets', None)
+        if cache is None:
+            cache = {}
+            try:
+                self.buildout._djangorecipe_working_sets = cache
+            except AttributeError:
+                # not a buildout object, the working set is not shared
+                pass
+        if key not in cache:
+            cache[key] = self.egg.working_set(['djangorecipe'])
+        return cache[key]
+
+    def create_scripts(self, extra_paths, ws):
+        # the settings option lists one or more settings modules, sharing
+        # the working set and the extra-paths. The scripts of the first one
+        # are not suffixed
+        paths = self.create_settings_scripts(extra_paths, ws)
+        try:
+            for settings in self.options['settings'].split()[1:]:
+                self.settings = settings
+                paths.extend(self.create_settings_scripts(extra_paths, ws))
+        finally:
+            self.settings = None
+        return paths
+
+    def create_settings_scripts(self, extra_paths, ws):
+        paths = []
+        suffix = ''
+        if self.settings:
+            suffix = ' (%s)' % self.settings
+
+        # Freeze the settings module if requested
+        if self.is_enabled('settings-snapshot'):
+            paths.extend(self.timed('settings-snapshot' + suffix,
+                                    self.create_settings_snapshot,
+                                    extra_paths, ws))
+
+        # Index the management commands if requested
+        if self.is_enabled('command-index'):
+            paths.extend(self.timed('command-index' + suffix,
+                                    self.create_command_index,
+                                    extra_paths, ws))
+
+        # Create the Django management script, the test runner and the wsgi
+        # script. They are written one after the other: zc.buildout changes
+        # the umask of the process while it sets their permissions
+        paths.extend(self.timed('manage-script' + suffix,
+                                self.create_manage_script, extra_paths, ws))
+        paths.extend(self.timed('test-runner' + suffix,
+                                self.create_test_runner, extra_paths, ws))
+        paths.extend(self.timed('wsgi-script' + suffix, self.make_scripts,
+                                extra_paths, ws))
+
+        # Collect the static files if requested
+        if self.is_enabled('collectstatic'):
+            paths.extend(self.timed('collectstatic' + suffix,
+                                    self.collect_static, extra_paths, ws))
+
+        # Compile the templates if requested
+        if self.is_enabled('template-check'):
+            paths.extend(self.timed('template-check' + suffix,
+                                    self.check_templates, extra_paths, ws))
+
+        # Pack the python path in a deployment bundle if requested
+        if self.is_enabled('bundle'):
+            paths.extend(self.timed('bundle' + suffix, self.create_bundle,
+                                    extra_paths, ws))
+
+        return paths
+
+    def get_settings(self):
+        return self.settings or self.options['settings'].split()[0]
+
+    def get_script_name(self, name):
+        # the scripts of the additional settings modules are suffixed with
+        # the name of the settings module
+        if not self.settings:
+            return name
+        base, ext = os.path.splitext(name)
+        return '%s-%s%s' % (base, self.settings.replace('.', '-'), ext)
+
+    def timed(self, phase, function, *args):
+        # run one phase of the install or update, and record its duration
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            duration = time.time() - start
+            self.timings.append((phase, duration))
+            self.log.debug('%s took %.3fs' % (phase, duration))
+
+    def report_timings(self):
+        # log the duration of the phases, and write them to the part
+        # directory if requested
+        if not self.is_enabled('timings'):
+            return []
+        total = sum([duration for phase, duration in self.timings])
+        self.log.info('%s took %.3fs: %s' % (
+            self.name, total, ', '.join(['%s %.3fs' % timing
+                                         for timing in self.timings])))
+        location = self.options['location']
+        make_dirs(location)
+        timings_path = os.path.join(location, 'timings.json')
+        timings_file = open(timings_path, 'w')
+        try:
+            json.dump({'total': total,
+                       'phases': [{'phase': phase, 'duration': duration}
+                                  for phase, duration in self.timings]},
+                      timings_file, indent=2)
+        finally:
+            timings_file.close()
+        return [timings_path]
+
+    def get_project_dir(self):
+        base_dir = self.buildout['buildout']['directory']
+
+        if self.root_pkg:
+            return os.path.join(base_dir, self.options['project'])
+        else:
+            return base_dir
+
+    def get_settings_module(self):
+        if self.snapshot_module:
+            return self.snapshot_module
+        return self.root_pkg + self.get_settings()
+
+    def create_settings_snapshot(self, extra_paths, ws):
+        # evaluate the settings at build time, in the environment of the
+        # generated scripts, and freeze them in a literal-only module that
+        # the scripts use instead of the settings module
+        self.snapshot_module = None
+        settings_module = self.get_settings_module()
+        snapshot_module = '%s_snapshot' % \
+            self.get_settings().replace('.', '_')
+        location = self.options['location']
+        make_dirs(location)
+        snapshot_path = os.path.join(location, snapshot_module + '.py')
+
+        if self.run_task(extra_paths, ws, 'djangorecipe.snapshot', 'freeze',
+                         "'%s', %r" % (settings_module, snapshot_path)):
+            self.log.warning('Could not freeze the %s settings module, the '
+                             'generated scripts will import it directly'
+                             % settings_module)
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+            return []
 
-        return script_paths
+        self.snapshot_module = snapshot_module
+        if location not in extra_paths:
+            extra_paths.append(location)
+        return [snapshot_path]
+
+    def create_command_index(self, extra_paths, ws):
+        # index the management commands of the installed applications, so
+        # that the control script does not need to scan them on each run.
+        # The index is only rebuilt when the python path changes
+        self.command_index = None
+        location = self.options['location']
+        make_dirs(location)
+        index_path = os.path.join(
+            location,
+            '%s_commands.json' % self.get_settings().replace('.', '_'))
+        settings_module = self.get_settings_module()
+        key = hashlib.md5(repr(
+            [(dist.location, dist.version) for dist in ws] +
+            list(extra_paths) + [settings_module]
+        ).encode('utf-8')).hexdigest()
+
+        index = load_json(index_path)
+        if index is None or index['key'] != key:
+            if self.run_task(extra_paths, ws, 'djangorecipe.commands',
+                             'build_index', "'%s', %r, '%s'" % (
+                                 settings_module, index_path, key)):
+                self.log.warning('Could not index the management commands, '
+                                 'the control script will discover them')
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+                return []
+
+        self.command_index = index_path
+        return [index_path]
+
+    def get_script_path(self, extra_paths, ws):
+        # the python path of the generated scripts: the eggs of the working
+        # set (and the paths of their .pth files) followed by the
+        # extra-paths, without duplicates
+        path = []
+        for location in [dist.location for dist in ws]:
+            path.append(location)
+            if get_pth_paths is not None:
+                path.extend(get_pth_paths(location))
+        path.extend(extra_paths)
+        unique_path = []
+        for p in path:
+            if p not in unique_path:
+                unique_path.append(p)
+        path = [os.path.realpath(p) for p in unique_path]
+
+        if self.is_enabled('sys-path-order'):
+            # put the entries used the most by the control script first
+            usage = load_json(self.get_path_profile())
+            if usage:
+                path = pathorder.reorder(path, usage)
+        return path
+
+    def get_path_profile(self):
+        return os.path.join(self.options['location'], 'path-profile.json')
+
+    def write_script(self, name, extra_paths, ws, module_name, arguments,
+                     initialization, template=None):
+        # replacement of zc.buildout.easy_install.scripts for the generated
+        # scripts that changes no global state: the template is passed
+        # explicitly instead of replacing the module global of zc.buildout
+        if template is None:
+            template = zc.buildout.easy_install.script_template
+        if initialization:
+            initialization = '\n' + initialization + '\n'
+        dest = os.path.join(self.options['bin-directory'], name)
+        python = sys.executable
+        if sys.platform == 'win32':
+            dest += '-script.py'
+            if ' ' in python:
+                python = '"%s"' % python
+        path = self.get_script_path(extra_paths, ws)
+        contents = template % dict(
+            python=python,
+            path=repr(path)[1:-1].replace(', ', ',\n  '),
+            module_name=module_name,
+            attrs='main',
+            arguments=arguments,
+            initialization=initialization,
+            relative_paths_setup='')
+        return self.create_script(contents, dest)
+
+    def create_script(self, contents, dest):
+        # writes the script if it changed and makes it executable. The mode
+        # is set explicitly, reading the umask would change it for the whole
+        # process
+        generated = []
+        if sys.platform == 'win32':
+            from setuptools.command.easy_install import get_win_launcher
+            launcher = dest[:-len('-script.py')] + '.exe'
+            f = open(launcher, 'wb')
+            try:
+                f.write(get_win_launcher('cli'))
+            finally:
+                f.close()
+            generated.append(launcher)
+
+        current = None
+        if os.path.exists(dest):
+            f = open(dest, 'r')
+            try:
+                current = f.read()
+            finally:
+                f.close()
+        if current != contents:
+            f = open(dest, 'w')
+            try:
+                f.write(contents)
+            finally:
+                f.close()
+            self.log.info('Generated script %r.', dest)
+            os.chmod(dest, int('755', 8))
+        generated.append(dest)
+        return generated
+
+    def compile_messages(self, extra_paths):
+        # compile the outdated catalogs of the project and the extra-paths.
+        # The directories of buildout itself are not searched
+        buildout = self.buildout['buildout']
+        roots = [self.get_project_dir()] + \
+            [p for p in extra_paths if p != buildout['directory']]
+        excluded = [buildout.get(name) for name in (
+            'bin-directory', 'develop-eggs-directory', 'eggs-directory',
+            'parts-directory', 'download-cache')
+            if buildout.get(name)]
+        workers = int(self.options.get('compilemessages-workers', '4'))
+
+        start = time.time()
+        results = messages.compile_messages(roots, excluded, workers)
+        failed = []
+        for po, duration, error in results:
+            if error:
+                self.log.error('Could not compile %s: %s' % (po, error))
+                failed.append(po)
+            else:
+                self.log.info('Compiled %s in %.3fs' % (po, duration))
+        self.log.info('Compiled %d message catalogs in %.3fs' % (
+            len(results) - len(failed), time.time() - start))
+        if failed:
+            raise UserError('Could not compile %d message catalogs'
+                            % len(failed))
+
+    def collect_static(self, extra_paths, ws):
+        # collect the static files in the environment of the generated
+        # scripts. The collected files are not returned, so that they are
+        # kept when the part is reinstalled and only the changed files are
+        # copied again
+        location = self.options['location']
+        make_dirs(location)
+        manifest_path = os.path.join(
+            location,
+            '%s_static.json' % self.get_settings().replace('.', '_'))
+        compressed = self.is_enabled('collectstatic-compress')
+        workers = int(self.options.get('collectstatic-workers', '8'))
+        if self.run_task(extra_paths, ws, 'djangorecipe.static', 'collect',
+                         "'%s', %r, compressed=%r, workers=%d" % (
+                             self.get_settings_module(), manifest_path,
+                             compressed, workers)):
+            raise UserError('Could not collect the static files of %s'
+                            % self.get_settings_module())
+        return []
+
+    def get_templates_path(self):
+        # the names of the templates the wsgi script loads on startup
+        if not self.is_enabled('template-warmup'):
+            return None
+        return os.path.join(
+            self.options['location'],
+            '%s_templates.json' % self.get_settings().replace('.', '_'))
+
+    def check_templates(self, extra_paths, ws):
+        # compile the templates in the environment of the generated scripts,
+        # and keep their names for the wsgi script if requested
+        location = self.options['location']
+        make_dirs(location)
+        templates_path = self.get_templates_path()
+        workers = int(self.options.get('template-check-workers', '8'))
+        arguments = "'%s', %r, workers=%d" % (self.get_settings_module(),
+                                              templates_path, workers)
+        if self.options.get('template-check-extensions'):
+            arguments += ', extensions=%r' % (tuple([
+                '.' + ext.lstrip('.') for ext in
+                self.options['template-check-extensions'].split()]),)
+        if self.run_task(extra_paths, ws, 'djangorecipe.templates', 'check',
+                         arguments):
+            raise UserError('Some templates of %s do not compile'
+                            % self.get_settings_module())
+        if templates_path:
+            return [templates_path]
+        return []
+
+    def run_task(self, extra_paths, ws, module_name, attrs, arguments):
+        # runs a function in a separate process that has the same python
+        # path and initialization as the generated scripts
+        path = self.get_script_path(extra_paths, ws)
+        initialization = self.options['initialization']
+        if initialization:
+            initialization = '\n' + initialization + '\n'
+        code = task_template % dict(
+            path=repr(path)[1:-1].replace(', ', ',\n  '),
+            initialization=initialization,
+            module_name=module_name,
+            attrs=attrs,
+            arguments=arguments)
+        return subprocess.call([sys.executable, '-c', code])
+
+    def create_bundle(self, extra_paths, ws):
+        # pack the python path of the scripts in a single archive, with entry
+        # points running the control script and the wsgi application. The
+        # eggs of the python installation are expected on the hosts
+        name = self.get_script_name(
+            self.options.get('control-script', self.name))
+        archive = os.path.join(self.options['location'], '%s.pyz' % name)
+        path = []
+        for entry in self.get_script_path(extra_paths, ws):
+            if bundle.is_system_path(entry):
+                self.log.debug('Leaving %s out of the bundle' % entry)
+            else:
+                path.append(entry)
+
+        initialization = self.options['initialization']
+        if initialization:
+            initialization = '\n' + initialization + '\n'
+        variables = dict(
+            path=repr(['lib/%d' % i
+                       for i in range(len(path))])[1:-1].replace(
+                           ', ', ',\n  '),
+            initialization=initialization,
+            attrs='main')
+        main = bundle_template['main'] % dict(
+            variables, module_name='djangorecipe.manage',
+            arguments="'%s'" % self.get_settings_module())
+        wsgi = bundle_template['wsgi'] % dict(
+            variables, module_name='djangorecipe.wsgi',
+            arguments=self.get_application_arguments())
+        if bundle.build(archive, path, [('__main__.py', main),
+                                        ('bundle_wsgi.py', wsgi)]):
+            self.log.info('Generated bundle %r.' % archive)
+        return [archive]
+
+    def get_initialization(self, script):
+        initialization = self.options['initialization']
+        if self.is_enabled('import-trace'):
+            # trace the imports of the script, including the ones of the
+            # initialization code
+            report_path = os.path.join(self.options['location'],
+                                       'import-trace-%s.txt' % script)
+            initialization = ('from djangorecipe import importtrace\n'
+                              'importtrace.start(%r)\n' % report_path +
+                              initialization)
+        return initialization
 
     def create_manage_script(self, extra_paths, ws):
-        return zc.buildout.easy_install.scripts(
-            [(self.options.get('control-script', self.name),
-              'djangorecipe.manage', 'main')],
-            ws, sys.executable, self.options['bin-directory'],
-            extra_paths=extra_paths,
-            arguments="'%s%s'" % (self.root_pkg, self.options['settings']),
-            initialization=self.options['initialization'])
+        arguments = "'%s'" % self.get_settings_module()
+        if self.command_index:
+            arguments += ', command_index=%r' % self.command_index
+        if self.is_enabled('profile'):
+            arguments += ', profile=%r' % os.path.join(
+                self.options['location'], 'profiles')
+        if self.is_enabled('sys-path-order'):
+            arguments += ', path_profile=%r' % self.get_path_profile()
+        script = self.get_script_name(
+            self.options.get('control-script', self.name))
+        return self.write_script(script, extra_paths, ws,
+                                 'djangorecipe.manage', arguments,
+                                 self.get_initialization(script))
 
     def create_test_runner(self, extra_paths, working_set):
         apps = self.options.get('test', '').split()
         # Only create the testrunner if the user requests it
         if apps:
-            return zc.buildout.easy_install.scripts(
-                [(self.options.get('testrunner', 'test'),
-                  'djangorecipe.test', 'main')],
-                working_set, sys.executable,
-                self.options['bin-directory'],
-                extra_paths=extra_paths,
-                arguments="'%s%s', %s" % (
-                    self.root_pkg,
-                    self.options['settings'],
-                    ', '.join(["'%s'" % app for app in apps])),
-                initialization=self.options['initialization'])
+            arguments = "'%s', %s" % (
+                self.get_settings_module(),
+                ', '.join(["'%s'" % app for app in apps]))
+            # used to select the tests affected by changes
+            arguments += ', paths=%r, location=%r' % (
+                list(extra_paths), self.options['location'])
+            if self.is_enabled('test-db-snapshot'):
+                arguments += ', db_snapshot=%r' % os.path.join(
+                    self.options['location'], 'testdb')
+            database = self.options.get('test-database')
+            if database:
+                if database not in ('memory', 'tmpfs'):
+                    raise UserError('test-database must be memory or tmpfs, '
+                                    'not %s' % database)
+                arguments += ', database=%r' % database
+            if self.is_enabled('test-fast-settings'):
+                arguments += ', fast_settings=True'
+            if self.options.get('test-report'):
+                arguments += ', report=%r, report_top=%s' % (
+                    os.path.join(self.buildout['buildout']['directory'],
+                                 self.options['test-report']),
+                    int(self.options.get('test-report-top', '10')))
+                if self.is_enabled('test-report-memory'):
+                    arguments += ', report_memory=True'
+            script = self.get_script_name(
+                self.options.get('testrunner', 'test'))
+            return self.write_script(script, extra_paths, working_set,
+                                     'djangorecipe.test', arguments,
+                                     self.get_initialization(script))
         else:
             return []
 
     def create_project(self, project_dir):
         # create the project directory if it does not exist
-        if not os.path.exists(project_dir):
-            os.makedirs(project_dir)
+        make_dirs(project_dir)
+
+        temp_path = self.get_template_path()
 
+        # prepare templating engine
+        template_vars = self.get_template_vars()
+
+        # copy files and run templating engine
+        created = []
+        for sub in os.listdir(temp_path):
+            src_path = os.path.join(temp_path, sub)
+            tgt_path = os.path.join(project_dir, sub)
+            if os.path.exists(tgt_path):
+                sys.stderr.write('ERROR: %s already exists in %s and ' \
+                    'cannot be overwritten by djangorecipe\'s template ' \
+                    'engine.\n' % (sub, project_dir))
+            else:
+                if os.path.isdir(src_path):
+                    # copy the subdirectory tree
+                    shutil.copytree(src_path, tgt_path)
+                    process_tree(tgt_path, template_vars)
+                else:
+                    # copy the file and run templating engine
+                    shutil.copy(src_path, tgt_path)
+                    process(tgt_path, template_vars)
+                created.append(sub)
+
+        # record the rendered files so that they can be upgraded later on
+        created = [render_name(sub, template_vars) for sub in created]
+        files = {}
+        for rel_path, src_path in template_files(temp_path, template_vars):
+            if rel_path.split(os.path.sep)[0] in created:
+                files[rel_path] = {
+                    'template': checksum(src_path),
+                    'rendered': checksum(os.path.join(project_dir, rel_path))}
+        self.write_manifest({'secret': template_vars['secret'],
+                             'files': files})
+
+    def upgrade_project(self, project_dir):
+        # re-render the files whose template changed since they were
+        # generated, as long as they were not modified by the user
+        if not self.is_enabled('upgrade-project'):
+            return
+        manifest = self.read_manifest()
+        if manifest is None:
+            self.log.debug('No project manifest, skipping project upgrade')
+            return
+
+        temp_path = self.get_template_path()
+        template_vars = self.get_template_vars()
+        if 'secret' not in self.options:
+            # keep the secret the project was generated with
+            template_vars['secret'] = manifest['secret']
+
+        files = manifest['files']
+        for rel_path, src_path in template_files(temp_path, template_vars):
+            template_hash = checksum(src_path)
+            entry = files.get(rel_path)
+            if entry and entry['template'] == template_hash:
+                continue
+            tgt_path = os.path.join(project_dir, rel_path)
+            if entry is None:
+                if os.path.exists(tgt_path):
+                    # not owned by the template
+                    continue
+            elif not os.path.exists(tgt_path):
+                # deleted by the user
+                continue
+            elif checksum(tgt_path) != entry['rendered']:
+                self.log.warning('%s was modified and will not be upgraded '
+                                 'to the new template' % tgt_path)
+                continue
+
+            tgt_dir = os.path.dirname(tgt_path)
+            make_dirs(tgt_dir)
+            content = render(src_path, template_vars)
+            tgt_file = open(tgt_path, 'w')
+            try:
+                tgt_file.write(content)
+            finally:
+                tgt_file.close()
+            self.log.info('Upgraded %s' % tgt_path)
+            files[rel_path] = {'template': template_hash,
+                               'rendered': checksum(tgt_path)}
+
+        self.write_manifest(manifest)
+
+    def get_manifest_path(self):
+        return os.path.join(self.options['location'], 'project-manifest.json')
+
+    def read_manifest(self):
+        manifest_path = self.get_manifest_path()
+        if not os.path.exists(manifest_path):
+            return None
+        manifest_file = open(manifest_path, 'r')
+        try:
+            return json.load(manifest_file)
+        finally:
+            manifest_file.close()
+
+    def write_manifest(self, manifest):
+        # the manifest holds the secret key the project was generated with,
+        # it is only readable by its owner
+        make_dirs(self.options['location'])
+        manifest_path = self.get_manifest_path()
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        manifest_file = os.fdopen(os.open(
+            manifest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+            int('600', 8)), 'w')
+        try:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        finally:
+            manifest_file.close()
+
+    def get_template_path(self):
         # retrieve user-provided template directories
-        template_dirs = self.buildout['djangorecipe'] \
+        template_dirs = self.buildout.get('djangorecipe', {}) \
                             .get('template-dirs', '') \
                             .splitlines()
 
         # retrieve template name
         template_name = self.options.get('template', None)
 
-        if template_name and template_dirs:
+        if template_name:
             # the user provided a template to load
 
             # look for a template in the template directories provided
-            # in reverse so that the last setting is prioritary
-            for d in reversed(template_dirs):
+            # in reverse so that the last setting is prioritary, and then in
+            # the templates bundled with djangorecipe
+            bundled_dir = os.path.join(os.path.dirname(__file__),
+                                       'named_templates')
+            for d in list(reversed(template_dirs)) + [bundled_dir]:
                 d = os.path.abspath(d)
                 if template_name in os.listdir(d):
                     # we have a template candidate, load it
                     temp_path = os.path.join(d, template_name)
                     break
+            else:
+                raise UserError('Template %s could not be found in the '
+                                'template directories.' % template_name)
 
         else:
             # no template name was provided
@@ -171,57 +745,83 @@ class Recipe(object):
 
             temp_path = os.path.join(temp_path, version)
 
-        # prepare templating engine
-        template_vars = self.get_template_vars()
+        return temp_path
 
-        # copy files and run templating engine
-        for sub in os.listdir(temp_path):
-            src_path = os.path.join(temp_path, sub)
-            tgt_path = os.path.join(project_dir, sub)
-            if os.path.exists(tgt_path):
-                sys.stderr.write('ERROR: %s already exists in %s and ' \
-                    'cannot be overwritten by djangorecipe\'s template ' \
-                    'engine.\n' % (sub, project_dir))
-            else:
-                if os.path.isdir(src_path):
-                    # copy the subdirectory tree
-                    shutil.copytree(src_path, tgt_path)
-                    process_tree(tgt_path, template_vars)
-                else:
-                    # copy the file and run templating engine
-                    shutil.copy(src_path, tgt_path)
-                    process(tgt_path, template_vars)
+    def preview_project(self, project_dir):
+        # render the template in memory only and report what create_project
+        # would do, without touching the project directory
+        temp_path = self.get_template_path()
+        template_vars = self.get_template_vars()
+        manifest = self.read_manifest()
+        if manifest is not None and 'secret' not in self.options:
+            # compare with the secret the project was generated with
+            template_vars['secret'] = manifest['secret']
+
+        start = time.time()
+        rendered = render_tree(temp_path, template_vars)
+        elapsed = time.time() - start
+
+        conflicts = [sub for sub in sorted(os.listdir(temp_path))
+                     if os.path.exists(os.path.join(project_dir, sub))]
+        # the files of the conflicting entries would be skipped
+        skipped = [render_name(sub, template_vars) for sub in conflicts]
+        created = [(rel_path, content) for rel_path, content in rendered
+                   if rel_path.split(os.path.sep)[0] not in skipped]
+        size = 0
+        for rel_path, content in created:
+            size += len(content.encode('utf-8'))
+            self.log.info('Would create %s' % os.path.join(project_dir,
+                                                           rel_path))
+        for sub in conflicts:
+            self.log.warning('%s already exists in %s and would not be '
+                             'overwritten' % (sub, project_dir))
+        self.log.info('Dry run: %d files, %d bytes, %d conflicts, projected '
+                      'time %.3fs' % (len(created), size, len(conflicts),
+                                      elapsed))
+
+        if self.is_enabled('dry-run-diff'):
+            for rel_path, content in rendered:
+                tgt_path = os.path.join(project_dir, rel_path)
+                if not os.path.isfile(tgt_path):
+                    continue
+                existing = open(tgt_path, 'r')
+                try:
+                    current = existing.readlines()
+                finally:
+                    existing.close()
+                sys.stdout.writelines(difflib.unified_diff(
+                    current, content.splitlines(True),
+                    tgt_path, os.path.join(temp_path, rel_path)))
 
     def make_scripts(self, extra_paths, ws):
         scripts = []
-        protocol = 'wsgi'
-
-        if self.options.get(protocol, '').lower() == 'true':
-            _script_template = zc.buildout.easy_install.script_template
-            protocol = 'wsgi'
-            zc.buildout.easy_install.script_template = \
-                zc.buildout.easy_install.script_header + \
-                script_template[protocol]
-
-            scripts.extend(
-                zc.buildout.easy_install.scripts(
-                    [(self.options.get('wsgi-script') or
-                      '%s.%s' % (self.options.get('control-script',
-                                                  self.name),
-                                 protocol),
-                      'djangorecipe.%s' % protocol, 'main')],
-                    ws,
-                    sys.executable,
-                    self.options['bin-directory'],
-                    extra_paths=extra_paths,
-                    arguments="'%s%s', logfile='%s'" % (
-                        self.root_pkg, self.options['settings'],
-                        self.options.get('logfile')),
-                    initialization=self.options['initialization']))
-            zc.buildout.easy_install.script_template = _script_template
+
+        for protocol in ('wsgi', 'asgi'):
+            if not self.is_enabled(protocol):
+                continue
+            if self.options.get('%s-script' % protocol):
+                script = self.get_script_name(
+                    self.options['%s-script' % protocol])
+            else:
+                script = '%s.%s' % (self.get_script_name(
+                    self.options.get('control-script', self.name)), protocol)
+            scripts.extend(self.write_script(
+                script, extra_paths, ws, 'djangorecipe.%s' % protocol,
+                self.get_application_arguments(),
+                self.get_initialization(script),
+                zc.buildout.easy_install.script_header +
+                script_template[protocol]))
 
         return scripts
 
+    def get_application_arguments(self):
+        arguments = "'%s', logfile='%s'" % (self.get_settings_module(),
+                                            self.options.get('logfile'))
+        templates_path = self.get_templates_path()
+        if templates_path:
+            arguments += ', templates=%r' % templates_path
+        return arguments
+
     def get_template_vars(self):
         today = date.today()
         t_vars = {
@@ -230,7 +830,12 @@ class Recipe(object):
             'root_pkg': self.root_pkg,
             'year': today.year,
             'month': today.month,
-            'day': today.day
+            'day': today.day,
+            # defaults for the production template
+            'conn_max_age': 600,
+            'cache_backend': 'django.core.cache.backends.locmem.LocMemCache',
+            'cache_location': '',
+            'cache_timeout': 300,
         }
         t_vars.update(self.options)
         t_vars.update(self.buildout.get('djangorecipe', {}))
@@ -250,36 +855,54 @@ class Recipe(object):
     def get_extra_paths(self):
         extra_paths = [self.buildout['buildout']['directory']]
 
-        # Add libraries found by a site .pth files to our extra-paths.
-        if 'pth-files' in self.options:
-            import site
-            for pth_file in self.options['pth-files'].splitlines():
-                pth_libs = site.addsitedir(pth_file, set())
-                if not pth_libs:
-                    self.log.warning(
-                        "No site *.pth libraries found for pth_file=%s" % (
-                            pth_file,))
-                else:
-                    self.log.info("Adding *.pth libraries=%s" % pth_libs)
-                    self.options['extra-paths'] += '\n' + '\n'.join(pth_libs)
-
         pythonpath = [p.replace('/', os.path.sep) for p in
                       self.options['extra-paths'].splitlines() if p.strip()]
-
         extra_paths.extend(pythonpath)
-        return extra_paths
 
-    def update(self):
-        extra_paths = self.get_extra_paths()
-        requirements, ws = self.egg.working_set(['djangorecipe'])
-        # Create the Django management script
-        self.create_manage_script(extra_paths, ws)
+        # Add libraries found by a site .pth files to our extra-paths. The
+        # .pth files are parsed, the site module would change our own
+        # sys.path and run their import lines
+        for pth_file in self.options.get('pth-files', '').splitlines():
+            if not pth_file.strip():
+                continue
+            pth_libs = pth.expand(pth_file.strip())
+            if not pth_libs:
+                self.log.warning(
+                    "No site *.pth libraries found for pth_file=%s" % (
+                        pth_file,))
+            else:
+                self.log.info("Adding *.pth libraries=%s" % pth_libs)
+                extra_paths.extend(pth_libs)
 
-        # Create the test runner
-        self.create_test_runner(extra_paths, ws)
+        # order preserving unique
+        unique_paths = []
+        for path in extra_paths:
+            if path not in unique_paths:
+                unique_paths.append(path)
+        return unique_paths
 
-        # Make the wsgi and fastcgi scripts if enabled
-        self.make_scripts(extra_paths, ws)
+    def update(self):
+        self.timings = []
+        extra_paths = self.timed('extra-paths', self.get_extra_paths)
+        requirements, ws = self.timed('working-set', self.get_working_set)
+
+        # Bring the project files up to date with the template, unless only
+        # a preview is requested
+        if self.is_enabled('dry-run'):
+            self.log.info('Dry run: the project files are not upgraded')
+        elif not self.options.get('projectegg'):
+            self.timed('project', self.upgrade_project,
+                       self.get_project_dir())
+
+        # Compile the message catalogs if requested
+        if self.is_enabled('compilemessages'):
+            self.timed('compilemessages', self.compile_messages, extra_paths)
+
+        self.create_scripts(extra_paths, ws)
+        self.report_timings()
+
+    def is_enabled(self, name):
+        return self.options.get(name, '').lower() == 'true'
 
     def generate_secret(self):
         chars = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)'
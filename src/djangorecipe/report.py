@@ -0,0 +1,218 @@
+"""
+Performance report of a test run: wall time and queries per test, memory
+per test class, written as JSON or JUnit XML. The memory is the growth of
+the high-water mark of the process while each class ran, or, on request, the
+peak of the memory allocated by the class as traced by tracemalloc, which
+slows the tests down
+"""
+
+import json
+import sys
+import unittest
+from xml.etree import ElementTree
+
+from djangorecipe.queries import QueryCounter, timer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def max_rss():
+    """
+    Returns the high-water mark of the memory of the process in KB, or None
+    when it is not available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # in bytes
+        rss = rss // 1024
+    return rss
+
+
+class Recorder(object):
+    """
+    Records the tests run through any unittest result
+    """
+
+    def __init__(self, memory=False):
+        # whether the allocations are traced
+        self.memory = memory and tracemalloc is not None
+        self.tests = []
+        self.classes = {}
+        self.current = None
+        self.current_class = None
+        # high-water mark of the process when the current class started
+        self.class_rss = None
+        self.counter = QueryCounter()
+        self.originals = {}
+
+    def install(self):
+        self.counter.install()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        recorder = self
+        result = unittest.TestResult
+        for name in ('startTest', 'stopTest', 'addError', 'addFailure',
+                     'addSkip', 'addExpectedFailure',
+                     'addUnexpectedSuccess'):
+            self.originals[name] = getattr(result, name)
+
+        def start_test(self, test):
+            recorder.start(test)
+            return recorder.originals['startTest'](self, test)
+
+        def stop_test(self, test):
+            recorder.stop(test)
+            return recorder.originals['stopTest'](self, test)
+
+        def outcome(name, status):
+            def add(self, test, *args):
+                recorder.set_status(test, status)
+                return recorder.originals[name](self, test, *args)
+            return add
+
+        result.startTest = start_test
+        result.stopTest = stop_test
+        result.addError = outcome('addError', 'error')
+        result.addFailure = outcome('addFailure', 'failure')
+        result.addSkip = outcome('addSkip', 'skipped')
+        result.addExpectedFailure = outcome('addExpectedFailure', 'passed')
+        result.addUnexpectedSuccess = outcome('addUnexpectedSuccess',
+                                              'failure')
+
+    def uninstall(self):
+        for name, original in self.originals.items():
+            setattr(unittest.TestResult, name, original)
+        self.originals = {}
+        self.counter.uninstall()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def start(self, test):
+        test_id = test.id()
+        class_name = test_id.rsplit('.', 1)[0]
+        if class_name != self.current_class:
+            self.current_class = class_name
+            self.class_rss = max_rss()
+            self.reset_peak()
+        queries, query_time = self.counter.totals()
+        self.current = {'id': test_id, 'class': class_name,
+                        'status': 'passed', 'start': timer(),
+                        'queries': queries, 'query_time': query_time}
+
+    def stop(self, test):
+        entry = self.current
+        if entry is None or entry['id'] != test.id():
+            return
+        self.current = None
+        queries, query_time = self.counter.totals()
+        entry['time'] = timer() - entry.pop('start')
+        entry['queries'] = queries - entry['queries']
+        entry['query_time'] = query_time - entry['query_time']
+        self.tests.append(entry)
+
+        stats = self.classes.setdefault(entry['class'], {'time': 0.0})
+        stats['time'] += entry['time']
+        if self.memory and tracemalloc.is_tracing():
+            stats['peak_memory'] = max(stats.get('peak_memory', 0),
+                                       tracemalloc.get_traced_memory()[1])
+        elif self.class_rss is not None:
+            # the high-water mark only grows, the class is attributed the
+            # growth while it ran
+            stats['max_rss_increase'] = max_rss() - self.class_rss
+
+    def set_status(self, test, status):
+        if self.current is not None and self.current['id'] == test.id():
+            self.current['status'] = status
+        else:
+            # errors in the class and module fixtures
+            self.tests.append({'id': test.id(), 'class': test.id(),
+                               'status': status, 'time': 0.0,
+                               'queries': 0, 'query_time': 0.0})
+
+    def reset_peak(self):
+        if not self.memory or not tracemalloc.is_tracing():
+            return
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.stop()
+            tracemalloc.start()
+
+    def slowest(self, top):
+        return sorted(self.tests, key=lambda t: t['time'], reverse=True)[:top]
+
+    def print_slowest(self, top, stream=None):
+        stream = stream or sys.stderr
+        if not top or not self.tests:
+            return
+        stream.write('\nSlowest tests:\n')
+        for test in self.slowest(top):
+            stream.write('%9.3fs %6d queries %8.3fs  %s\n' % (
+                test['time'], test['queries'], test['query_time'],
+                test['id']))
+
+    def write_json(self, path):
+        queries, query_time = self.counter.totals()
+        report = {'tests': self.tests,
+                  'classes': self.classes,
+                  'total_time': sum([t['time'] for t in self.tests]),
+                  'queries': queries,
+                  'query_time': query_time,
+                  'databases': dict([(alias, {'queries': s[0], 'time': s[1]})
+                                     for alias, s
+                                     in self.counter.stats.items()])}
+        report_file = open(path, 'w')
+        try:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+        finally:
+            report_file.close()
+
+    def write_junit(self, path):
+        suite = ElementTree.Element('testsuite', {
+            'name': 'djangorecipe',
+            'tests': str(len(self.tests)),
+            'failures': str(len([t for t in self.tests
+                                 if t['status'] == 'failure'])),
+            'errors': str(len([t for t in self.tests
+                               if t['status'] == 'error'])),
+            'skipped': str(len([t for t in self.tests
+                                if t['status'] == 'skipped'])),
+            'time': '%.3f' % sum([t['time'] for t in self.tests])})
+        for test in self.tests:
+            case = ElementTree.SubElement(suite, 'testcase', {
+                'classname': test['class'],
+                'name': test['id'][len(test['class']) + 1:] or test['id'],
+                'time': '%.3f' % test['time']})
+            if test['status'] != 'passed':
+                ElementTree.SubElement(case, test['status'])
+            properties = ElementTree.SubElement(case, 'properties')
+            for name in ('queries', 'query_time'):
+                ElementTree.SubElement(properties, 'property', {
+                    'name': name, 'value': str(test[name])})
+        ElementTree.ElementTree(suite).write(path, 'utf-8')
+
+    def write(self, path, top=10):
+        self.print_slowest(top)
+        if path.endswith('.xml'):
+            self.write_junit(path)
+        else:
+            self.write_json(path)
+
+
+def install(memory=False):
+    """
+    Starts recording the tests, and returns the recorder
+    """
+    recorder = Recorder(memory)
+    recorder.install()
+    return recorder
@@ -0,0 +1,109 @@
+"""
+Frozen, literal-only snapshots of settings modules
+"""
+
+import os
+import pprint
+import sys
+
+from djangorecipe.templating import checksum
+
+
+snapshot_template = """\
+# Frozen snapshot of the %(module_name)s settings module, generated by
+# djangorecipe. Do not edit: it is overwritten on each buildout run.
+from djangorecipe.snapshot import is_stale
+
+if is_stale(%(checksums)s):
+    from %(module_name)s import *
+else:
+%(settings)s
+"""
+
+
+def is_stale(checksums):
+    """
+    Tells whether any of the source files of a snapshot changed since it was
+    taken
+    """
+    for path, digest in checksums.items():
+        if not os.path.exists(path) or checksum(path) != digest:
+            return True
+    return False
+
+
+def source_path(module):
+    """
+    Returns the path to the source file of the module, if any
+    """
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    if not os.path.exists(path):
+        return None
+    return path
+
+
+def freeze(settings_module, target):
+    """
+    Imports the settings module and writes a snapshot of its settings to the
+    target file. The snapshot falls back to the settings module as soon as the
+    source files of the settings module or of the modules of the same
+    package it imported change. Returns a non-zero exit code if any setting
+    can not be written as a literal
+    """
+    import ast
+
+    root = settings_module.split('.')[0]
+    before = set(sys.modules)
+    __import__(settings_module)
+    module = sys.modules[settings_module]
+
+    checksums = {}
+    for name in set(sys.modules) - before:
+        if name != root and not name.startswith(root + '.'):
+            continue
+        path = source_path(sys.modules[name])
+        if path:
+            checksums[path] = checksum(path)
+
+    lines = []
+    non_literal = []
+    for name in sorted(dir(module)):
+        if not name.isupper():
+            continue
+        value = getattr(module, name)
+        try:
+            is_literal = ast.literal_eval(repr(value)) == value
+        except (SyntaxError, ValueError):
+            is_literal = False
+        if not is_literal:
+            non_literal.append(name)
+            continue
+        lines.append('%s = %s' % (name, pprint.pformat(value).replace(
+            '\n', '\n' + ' ' * (len(name) + 3))))
+
+    if non_literal:
+        sys.stderr.write('Settings %s of %s can not be frozen as literals\n'
+                         % (', '.join(non_literal), settings_module))
+        return 1
+
+    settings = '\n'.join(lines) or 'pass'
+    checksums = pprint.pformat(checksums).replace('\n', '\n' + ' ' * 12)
+    # the snapshot holds the secret key and the database credentials, it is
+    # only readable by its owner
+    if os.path.exists(target):
+        os.remove(target)
+    snapshot = os.fdopen(os.open(
+        target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, int('600', 8)), 'w')
+    try:
+        snapshot.write(snapshot_template % {
+            'module_name': settings_module,
+            'checksums': checksums,
+            'settings': '\n'.join(['    ' + line
+                                   for line in settings.splitlines()])})
+    finally:
+        snapshot.close()
+    return 0
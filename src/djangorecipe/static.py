@@ -0,0 +1,209 @@
+"""
+Incremental collection of the static files at buildout time. The files are
+hashed and copied by a pool of threads, and the files whose content did not
+change since the last collection, according to a manifest, are skipped.
+Precompressed variants can be written next to the collected files
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from djangorecipe.templating import load_json, make_dirs
+
+
+# Extensions of the files worth compressing
+compressed_exts = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.html',
+                   '.xml', '.ico', '.eot', '.ttf', '.otf')
+# Used when the staticfiles application does not define them
+default_ignore_patterns = ['CVS', '.*', '*~']
+
+
+def file_hash(path):
+    digest = hashlib.md5()
+    f = open(path, 'rb')
+    try:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+
+def run_pool(function, items, workers):
+    """
+    Calls the function on each item from a pool of threads, and returns the
+    results in order. The first exception is raised again
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    pending = queue.Queue()
+    for i, item in enumerate(items):
+        pending.put((i, item))
+
+    def work():
+        while not errors:
+            try:
+                i, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[i] = function(item)
+            except Exception:
+                errors.append(sys.exc_info()[1])
+
+    threads = [threading.Thread(target=work)
+               for i in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def compress(path, content):
+    """
+    Writes the gzip and, when available, brotli variants of the file
+    """
+    variants = [path + '.gz']
+    gz = open(path + '.gz', 'wb')
+    try:
+        # a fixed modification time keeps the variant reproducible
+        archive = gzip.GzipFile(os.path.basename(path), 'wb', 9, gz, 0)
+        try:
+            archive.write(content)
+        finally:
+            archive.close()
+    finally:
+        gz.close()
+    if brotli is not None:
+        br = open(path + '.br', 'wb')
+        try:
+            br.write(brotli.compress(content))
+        finally:
+            br.close()
+        variants.append(path + '.br')
+    return variants
+
+
+def find_files():
+    """
+    Returns the {destination path: source path} mapping of the static files
+    found by the finders, the first file found for a path winning as with
+    the collectstatic command
+    """
+    from django.contrib.staticfiles.finders import get_finders
+    try:
+        from django.apps import apps
+        ignore_patterns = apps.get_app_config('staticfiles').ignore_patterns
+    except (ImportError, AttributeError, LookupError):
+        # Django < 1.7 has no application configs, the collectstatic command
+        # uses the default patterns
+        ignore_patterns = default_ignore_patterns
+
+    found = {}
+    for finder in get_finders():
+        for path, storage in finder.list(ignore_patterns):
+            if getattr(storage, 'prefix', None):
+                prefixed_path = os.path.join(storage.prefix, path)
+            else:
+                prefixed_path = path
+            if prefixed_path not in found:
+                found[prefixed_path] = storage.path(path)
+    return found
+
+
+def collect_file(source, target, previous, compressed):
+    """
+    Copies the source file to the target unless the target has the same
+    content already, and returns its manifest entry
+    """
+    stat = os.stat(source)
+    if previous and previous['size'] == stat.st_size and \
+            previous['mtime'] == stat.st_mtime:
+        digest = previous['hash']
+    else:
+        digest = file_hash(source)
+    entry = {'source': source, 'size': stat.st_size,
+             'mtime': stat.st_mtime, 'hash': digest,
+             'compressed': compressed, 'copied': False}
+    if previous and previous['hash'] == digest and \
+            previous.get('compressed') == compressed and \
+            os.path.exists(target):
+        return entry
+
+    make_dirs(os.path.dirname(target))
+    shutil.copy2(source, target)
+    if compressed and target.endswith(compressed_exts):
+        f = open(source, 'rb')
+        try:
+            compress(target, f.read())
+        finally:
+            f.close()
+    entry['copied'] = True
+    return entry
+
+
+def collect(settings_file, manifest_path, compressed=False, workers=8):
+    """
+    Collects the static files of the project to STATIC_ROOT. Storages that
+    are not plain file system storages, or that post-process the files, are
+    handed to the collectstatic command
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.core.files.storage import FileSystemStorage
+    from django.core.management import call_command
+
+    if not isinstance(staticfiles_storage, FileSystemStorage) or \
+            hasattr(staticfiles_storage, 'post_process'):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return 0
+
+    manifest = load_json(manifest_path, {})
+    found = find_files()
+    paths = sorted(found)
+
+    def collect_path(path):
+        return collect_file(found[path], staticfiles_storage.path(path),
+                            manifest.get(path), compressed)
+
+    entries = run_pool(collect_path, paths, workers)
+    updated = dict(zip(paths, entries))
+
+    # remove the files collected earlier that are gone from the sources
+    for path in set(manifest) - set(updated):
+        target = staticfiles_storage.path(path)
+        for stale in (target, target + '.gz', target + '.br'):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    copied = len([entry for entry in entries if entry.pop('copied')])
+    f = open(manifest_path, 'w')
+    try:
+        json.dump(updated, f, indent=2, sort_keys=True)
+    finally:
+        f.close()
+    sys.stdout.write('%d static files copied, %d unmodified.\n'
+                     % (copied, len(entries) - copied))
+    return 0
@@ -0,0 +1,213 @@
+"""
+Build-time check of the templates: the templates of the template directories
+are compiled by a pool of processes forked once Django is set up, and the
+syntax errors and compile times are reported. The names of the templates can
+be kept for the wsgi script, which loads them on startup to fill the cached
+template loader
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from djangorecipe.templating import load_json
+
+
+# Extensions of the files compiled by default
+default_extensions = ('.html', '.htm', '.txt', '.xml', '.json', '.jinja',
+                      '.jinja2', '.j2', '.tpl')
+# Templates being compiled, inherited by the forked processes
+pending = []
+
+
+def template_dirs():
+    """
+    Returns the (engine, directory) pairs of the template directories, the
+    application directories included, in the order the loaders search them
+    """
+    try:
+        from django.template import engines
+    except ImportError:
+        # Django < 1.8
+        from django.conf import settings
+        from django.template.loaders.app_directories import app_template_dirs
+        return [(None, d) for d in
+                list(settings.TEMPLATE_DIRS) + list(app_template_dirs)]
+    dirs = []
+    for engine in engines.all():
+        directories = None
+        if hasattr(engine, 'engine'):
+            # the Django backend, whose loaders may be configured explicitly
+            directories = loader_dirs(engine.engine.template_loaders)
+        if not directories:
+            directories = engine.template_dirs
+        for directory in directories:
+            dirs.append((engine, str(directory)))
+    return dirs
+
+
+def loader_dirs(loaders):
+    """
+    Returns the directories searched by the template loaders, those of the
+    loaders wrapped by the cached loader included
+    """
+    dirs = []
+    for loader in loaders:
+        if hasattr(loader, 'loaders'):
+            dirs.extend(loader_dirs(loader.loaders))
+        elif hasattr(loader, 'get_dirs'):
+            dirs.extend(loader.get_dirs())
+    return dirs
+
+
+def find_templates(extensions=default_extensions):
+    """
+    Returns the (engine, name, path) triples of the template files with one
+    of the extensions, the first file found for a name winning as with the
+    template loaders
+    """
+    extensions = tuple([ext.lower() for ext in extensions])
+    templates = []
+    seen = set()
+    for engine, directory in template_dirs():
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = sorted([d for d in dirnames
+                                  if not d.startswith('.')])
+            for filename in sorted(filenames):
+                if filename.startswith('.') or \
+                        not filename.lower().endswith(extensions):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, directory).replace(os.sep, '/')
+                if (engine, name) not in seen:
+                    seen.add((engine, name))
+                    templates.append((engine, name, path))
+    return templates
+
+
+def compile_template(template):
+    """
+    Compiles the template, and returns its status (ok, error or skipped when
+    it is not text), its compile time and the error message
+    """
+    engine, name, path = template
+    f = open(path, 'rb')
+    try:
+        source = f.read()
+    finally:
+        f.close()
+    try:
+        source = source.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'skipped', 0.0, 'not UTF-8 text'
+    start = time.time()
+    try:
+        if engine is None:
+            from django.template import Template
+            Template(source)
+        else:
+            engine.from_string(source)
+    except Exception:
+        return 'error', time.time() - start, '%s: %s' % (
+            sys.exc_info()[0].__name__, sys.exc_info()[1])
+    return 'ok', time.time() - start, None
+
+
+def compile_pending(index):
+    return compile_template(pending[index])
+
+
+def compile_templates(templates, workers):
+    """
+    Compiles the templates, in forked processes that share the set up Django
+    when the platform allows it, and returns the results in order
+    """
+    if workers < 2 or len(templates) < 2 or not hasattr(os, 'fork'):
+        return [compile_template(template) for template in templates]
+    pending[:] = templates
+    try:
+        context = multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2 forks
+        context = multiprocessing
+    pool = context.Pool(min(workers, len(templates)))
+    try:
+        return pool.map(compile_pending, range(len(templates)))
+    finally:
+        pool.close()
+        pool.join()
+        del pending[:]
+
+
+def check(settings_file, templates_path=None, workers=8, top=10,
+          extensions=default_extensions):
+    """
+    Compiles the templates of the project and reports the errors, the
+    skipped files and the slowest templates. The names of the templates that
+    compile are written to the templates file, slowest first, if given
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+
+    templates = find_templates(extensions)
+    start = time.time()
+    results = compile_templates(templates, workers)
+    duration = time.time() - start
+
+    timings = []
+    errors = skipped = 0
+    for (engine, name, path), (status, compile_time, message) in zip(
+            templates, results):
+        if status == 'error':
+            sys.stderr.write('%s: %s\n' % (path, message))
+            errors += 1
+        elif status == 'skipped':
+            sys.stdout.write('Skipped %s: %s\n' % (path, message))
+            skipped += 1
+        else:
+            timings.append((compile_time, name))
+    timings.sort(reverse=True)
+
+    if timings:
+        sys.stdout.write('Slowest templates:\n')
+        for compile_time, name in timings[:top]:
+            sys.stdout.write('  %.4fs %s\n' % (compile_time, name))
+    sys.stdout.write('%d templates compiled in %.3fs, %d skipped, %d '
+                     'errors.\n' % (len(templates) - skipped, duration,
+                                     skipped, errors))
+
+    if templates_path:
+        names = []
+        for compile_time, name in timings:
+            if name not in names:
+                names.append(name)
+        f = open(templates_path, 'w')
+        try:
+            json.dump(names, f, indent=2)
+        finally:
+            f.close()
+    return errors and 1 or 0
+
+
+def warm_up(templates_path):
+    """
+    Loads the templates listed in the file, which fills the cached template
+    loader before the first request
+    """
+    names = load_json(templates_path)
+    if names is None:
+        return 0
+    from django.template.loader import get_template
+    loaded = 0
+    for name in names:
+        try:
+            get_template(name)
+        except Exception:
+            # left to fail on the request that renders it
+            continue
+        loaded += 1
+    return loaded
@@ -2,11 +2,15 @@
 Carry out template-based replacements in project files
 """
 
+import hashlib
+import json
 import os, sys
+import zipfile
 from string import Template
 
-script_template = {
-    'wsgi': """
+# Entry points of the wsgi and asgi servers, which only differ by the module
+# they call
+application_template = """
 
 %(relative_paths_setup)s
 import sys
@@ -16,11 +20,156 @@ sys.path[0:0] = [
 %(initialization)s
 import %(module_name)s
 
+application = %(module_name)s.%(attrs)s(%(arguments)s)
+"""
+
+script_template = {
+    'wsgi': application_template,
+    'asgi': application_template,
+}
+
+# Build-time tasks run in the same environment as the generated scripts
+task_template = """
+import sys
+sys.path[0:0] = [
+  %(path)s,
+  ]
+%(initialization)s
+import %(module_name)s
+
+sys.exit(%(module_name)s.%(attrs)s(%(arguments)s))
+"""
+
+# Entry points of the deployment bundles, run from the archive
+bundle_header = """
+import os
+import sys
+
+archive = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(archive, p) for p in [
+  %(path)s,
+  ]]
+%(initialization)s
+from djangorecipe import bundle
+bundle.activate(archive)
+import %(module_name)s
+"""
+
+bundle_template = {
+    'main': bundle_header + """
+if __name__ == '__main__':
+    sys.exit(%(module_name)s.%(attrs)s(%(arguments)s))
+""",
+    'wsgi': bundle_header + """
 application = %(module_name)s.%(attrs)s(%(arguments)s)
 """,
 }
 
 
+def render_name(name, mapping):
+    """
+    Returns the file or directory name with its replacement strings substituted
+    """
+    if '${' in name:
+        return Template(name).substitute(mapping)
+    return name
+
+
+def render(f, mapping):
+    """
+    Returns the file content with its replacement strings substituted, leaving
+    the file untouched
+    """
+    t_file = open(f, 'r')
+    try:
+        return Template(t_file.read()).substitute(mapping)
+    except Exception as e:
+        sys.stderr.write("""
+
+ERROR: while running template engine on file %s
+
+""" % f)
+        raise e
+    finally:
+        t_file.close()
+
+
+def template_files(directory, mapping):
+    """
+    Lists the files in the directory and its children. Returns a list of
+    (relative path, source path) tuples, the relative paths having their
+    replacement strings substituted
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, directory)
+        if rel_dir == os.curdir:
+            rel_parts = []
+        else:
+            rel_parts = [render_name(p, mapping)
+                         for p in rel_dir.split(os.path.sep)]
+        for f in sorted(filenames):
+            rel_path = os.path.join(*(rel_parts + [render_name(f, mapping)]))
+            files.append((rel_path, os.path.join(dirpath, f)))
+    return files
+
+
+def render_tree(directory, mapping):
+    """
+    Renders the directory and its children in memory. Returns a list of
+    (relative path, content) tuples
+    """
+    return [(rel_path, render(src_path, mapping))
+            for rel_path, src_path in template_files(directory, mapping)]
+
+
+def checksum(path):
+    """
+    Returns the md5 hex digest of the file content
+    """
+    f = open(path, 'rb')
+    try:
+        return hashlib.md5(f.read()).hexdigest()
+    finally:
+        f.close()
+
+
+def load_json(path, default=None, member=None):
+    """
+    Returns the JSON document stored in the file, or in the member of the zip
+    archive if given, or the default if it can not be read
+    """
+    try:
+        if member is None:
+            f = open(path, 'r')
+            try:
+                return json.load(f)
+            finally:
+                f.close()
+        archive = zipfile.ZipFile(path)
+        try:
+            return json.loads(archive.read(member).decode('utf-8'))
+        finally:
+            archive.close()
+    except (IOError, KeyError, ValueError, zipfile.BadZipfile):
+        return default
+
+
+def make_dirs(path):
+    """
+    Creates the directory and its parents, unless it exists
+    """
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(path)
+    except OSError:
+        # created concurrently
+        if not os.path.isdir(path):
+            raise
+
+
 def replace_name(path, mapping):
     """
     Handles replacement strings in the file or directory name
@@ -1,9 +1,126 @@
 import os
+import sys
+import tempfile
+import time
 
 from django.core import management
 
+from djangorecipe.templating import make_dirs
 
-def main(settings_file, *apps):
+
+def select_tests(apps, paths, location, ref):
+    """
+    Returns the test modules of the apps that are affected by the files
+    changed since the git reference, or since the last green run if no
+    reference is given. Returns None if the changes can not be determined
+    """
+    from djangorecipe import depgraph
+    make_dirs(location)
+    graph = depgraph.update_graph(paths,
+                                  os.path.join(location, 'depgraph.json'))
+
+    if ref:
+        try:
+            changed = depgraph.git_changes(ref, paths[0])
+        except OSError as e:
+            sys.stderr.write('Could not list the changes: %s\n' % e)
+            return None
+    else:
+        last_green = os.path.join(location, 'last-green')
+        if not os.path.exists(last_green):
+            return None
+        since = os.path.getmtime(last_green)
+        changed = [path for path, entry in graph.items()
+                   if entry['mtime'] > since]
+
+    return depgraph.affected_tests(graph, changed, apps)
+
+
+def tmpfs_dir():
+    """
+    Returns a memory backed directory for the test databases
+    """
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def override_settings(database=None, fast_settings=False):
+    """
+    Replaces the settings that slow the tests down, without changing the
+    settings module. The databases are replaced by in-memory SQLite databases
+    or by SQLite files stored on tmpfs
+    """
+    from django.conf import settings
+    if database:
+        databases = {}
+        for alias, db in settings.DATABASES.items():
+            test_settings = dict(db.get('TEST', {}))
+            if database == 'memory':
+                name = ':memory:'
+            else:
+                name = os.path.join(tmpfs_dir(), 'djangorecipe-%s-%s.sqlite3'
+                                    % (os.getpid(), alias))
+            test_settings['NAME'] = name
+            databases[alias] = {'ENGINE': 'django.db.backends.sqlite3',
+                                'NAME': name,
+                                'TEST': test_settings}
+        settings.DATABASES = databases
+    if fast_settings:
+        settings.PASSWORD_HASHERS = [
+            'django.contrib.auth.hashers.MD5PasswordHasher']
+        settings.EMAIL_BACKEND = \
+            'django.core.mail.backends.locmem.EmailBackend'
+
+
+def main(settings_file, *apps, **options):
     argv = ['test', 'test'] + list(apps)
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
-    management.execute_from_command_line(argv)
+    location = options.get('location')
+    started = time.time()
+
+    for arg in sys.argv[1:]:
+        if location and (arg == '--changed' or arg.startswith('--changed=')):
+            labels = select_tests(apps, options.get('paths', []), location,
+                                  arg.partition('=')[2])
+            if labels == []:
+                sys.stdout.write('No tests affected by the changes\n')
+                return 0
+            if labels is not None:
+                argv = ['test', 'test'] + labels
+
+    if options.get('database') or options.get('fast_settings'):
+        override_settings(options.get('database'),
+                          options.get('fast_settings', False))
+
+    if options.get('db_snapshot'):
+        from djangorecipe import testdb
+        testdb.install(options['db_snapshot'])
+
+    recorder = None
+    if options.get('report'):
+        from djangorecipe import report
+        recorder = report.install(options.get('report_memory', False))
+
+    if location and '--watch' in sys.argv[1:]:
+        from djangorecipe import watch
+
+        def run(labels):
+            management.execute_from_command_line(['test', 'test'] + labels)
+        return watch.watch(run, apps, options.get('paths', []), location)
+
+    try:
+        try:
+            management.execute_from_command_line(argv)
+        except SystemExit as e:
+            if e.code:
+                raise
+    finally:
+        if recorder is not None:
+            recorder.write(options['report'], options.get('report_top', 10))
+    if location:
+        # remember the last green run for --changed
+        make_dirs(location)
+        last_green = os.path.join(location, 'last-green')
+        open(last_green, 'w').close()
+        os.utime(last_green, (started, started))
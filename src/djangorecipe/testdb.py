@@ -0,0 +1,163 @@
+"""
+Snapshots of fully set up test databases. The test runner clones the snapshot
+instead of creating the test database and running the migrations and initial
+fixtures, as long as the models, migrations and fixtures do not change
+"""
+
+import glob
+import hashlib
+import os
+import shutil
+
+from djangorecipe.templating import make_dirs
+
+
+# Directories and modules of an application the test database depends on
+state_names = ('models', 'models.py', 'migrations', 'fixtures')
+
+
+def snapshot_key(paths, extra=()):
+    """
+    Returns a hash of the content of the models, migrations and fixtures
+    found in the given application directories
+    """
+    key = hashlib.md5()
+    for value in extra:
+        key.update(repr(value).encode('utf-8'))
+    for path in paths:
+        for name in state_names:
+            state_path = os.path.join(path, name)
+            if os.path.isfile(state_path):
+                files = [state_path]
+            else:
+                files = []
+                for dirpath, dirnames, filenames in os.walk(state_path):
+                    dirnames.sort()
+                    files.extend([os.path.join(dirpath, f)
+                                  for f in sorted(filenames)
+                                  if not f.endswith(('.pyc', '.pyo'))])
+            for f in files:
+                key.update(f.encode('utf-8'))
+                state_file = open(f, 'rb')
+                try:
+                    key.update(state_file.read())
+                finally:
+                    state_file.close()
+    return key.hexdigest()
+
+
+def project_key(connection):
+    """
+    Returns the snapshot key of the test database of the connection
+    """
+    import django
+    from django.apps import apps
+    from django.conf import settings
+    paths = [app_config.path for app_config in apps.get_app_configs()]
+    paths.extend(getattr(settings, 'FIXTURE_DIRS', ()))
+    return snapshot_key(paths, (django.VERSION, connection.vendor,
+                                connection.alias))
+
+
+def remove_stale(pattern, current):
+    for path in glob.glob(pattern):
+        if path != current:
+            os.remove(path)
+
+
+def nodb_cursor(connection):
+    if hasattr(connection, '_nodb_cursor'):
+        return connection._nodb_cursor()
+    return connection._nodb_connection.cursor()
+
+
+def database_names(connection, prefix):
+    with nodb_cursor(connection) as cursor:
+        cursor.execute('SELECT datname FROM pg_database '
+                       'WHERE datname LIKE %s', [prefix + '%'])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_sqlite(original, creation, snapshot_dir, key, args, kwargs):
+    connection = creation.connection
+    test_settings = connection.settings_dict['TEST']
+    test_name = test_settings.get('NAME')
+    if not test_name or test_name == ':memory:' or \
+            'mode=memory' in test_name:
+        # the snapshot is copied to a file database
+        test_settings['NAME'] = os.path.join(
+            snapshot_dir, 'test_%s.sqlite3' % connection.alias)
+    test_name = creation._get_test_db_name()
+    snapshot = os.path.join(snapshot_dir,
+                            '%s-%s.sqlite3' % (connection.alias, key))
+
+    if os.path.exists(snapshot):
+        shutil.copyfile(snapshot, test_name)
+        kwargs['keepdb'] = True
+        return original(creation, *args, **kwargs)
+
+    if not kwargs.get('keepdb') and os.path.exists(test_name):
+        os.remove(test_name)
+    name = original(creation, *args, **kwargs)
+    connection.close()
+    shutil.copyfile(test_name, snapshot)
+    remove_stale(os.path.join(snapshot_dir,
+                              '%s-*.sqlite3' % connection.alias), snapshot)
+    return name
+
+
+def create_postgresql(original, creation, key, args, kwargs):
+    connection = creation.connection
+    quote = connection.ops.quote_name
+    test_name = creation._get_test_db_name()
+    prefix = '%s_snap_' % test_name[:50]
+    snapshot = prefix + key[:12]
+    snapshots = database_names(connection, prefix)
+
+    if snapshot in snapshots:
+        with nodb_cursor(connection) as cursor:
+            cursor.execute('DROP DATABASE IF EXISTS %s' % quote(test_name))
+            cursor.execute('CREATE DATABASE %s TEMPLATE %s'
+                           % (quote(test_name), quote(snapshot)))
+        kwargs['keepdb'] = True
+        return original(creation, *args, **kwargs)
+
+    name = original(creation, *args, **kwargs)
+    # the test database can not be used as a template while connected
+    connection.close()
+    with nodb_cursor(connection) as cursor:
+        for stale in snapshots:
+            cursor.execute('DROP DATABASE IF EXISTS %s' % quote(stale))
+        cursor.execute('CREATE DATABASE %s TEMPLATE %s'
+                       % (quote(snapshot), quote(test_name)))
+    return name
+
+
+def install(snapshot_dir):
+    """
+    Makes the creation of the test databases go through the snapshots stored
+    in the given directory. SQLite databases are copied, PostgreSQL databases
+    are cloned from template databases. Other databases are created as usual
+    """
+    import django
+    if django.VERSION < (1, 8):
+        # reusing an existing test database requires keepdb
+        return False
+    from django.db.backends.base.creation import BaseDatabaseCreation
+
+    make_dirs(snapshot_dir)
+    original = BaseDatabaseCreation.create_test_db
+
+    def create_test_db(self, *args, **kwargs):
+        vendor = self.connection.vendor
+        if vendor == 'sqlite':
+            return create_sqlite(original, self, snapshot_dir,
+                                 project_key(self.connection), args, kwargs)
+        if vendor == 'postgresql':
+            return create_postgresql(original, self,
+                                     project_key(self.connection),
+                                     args, kwargs)
+        return original(self, *args, **kwargs)
+
+    BaseDatabaseCreation.create_test_db = create_test_db
+    return True
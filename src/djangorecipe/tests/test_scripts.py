@@ -1,5 +1,9 @@
+import json
 import os
+import shutil
 import sys
+import tempfile
+import time
 import unittest
 
 import mock
@@ -56,6 +60,611 @@ class TestTestScript(ScriptTestCase):
         self.assertEqual(mock_setdefault.call_args[0],
                          ('DJANGO_SETTINGS_MODULE', 'cheeseshop.nce.development'))
 
+    @mock.patch('django.core.management.execute_from_command_line')
+    @mock.patch('os.environ.setdefault')
+    @mock.patch('djangorecipe.testdb.install')
+    def test_script_db_snapshot(self, install, mock_setdefault,
+                                execute_from_command_line):
+        # The test database can be cloned from a snapshot
+        from djangorecipe import test
+        test.main('cheeseshop.development', 'spamm', db_snapshot='/testdb')
+        self.assertEqual(install.call_args, (('/testdb',), {}))
+        self.assertEqual(execute_from_command_line.call_args[0],
+                         (['test', 'test', 'spamm'],))
+
+    @mock.patch('django.core.management.execute_from_command_line')
+    @mock.patch('os.environ.setdefault')
+    @mock.patch('sys.argv', ['test', '--changed'])
+    def test_script_changed(self, mock_setdefault, execute_from_command_line):
+        # With --changed, only the tests affected by the changes since the
+        # last green run are run
+        from djangorecipe import test
+        root = tempfile.mkdtemp('djangorecipe')
+        location = os.path.join(root, 'parts')
+        try:
+            os.makedirs(os.path.join(root, 'knight', 'tests'))
+            for name, content in (
+                    ('__init__.py', ''),
+                    ('models.py', ''),
+                    ('views.py', ''),
+                    ('tests/__init__.py', ''),
+                    ('tests/test_models.py', 'from knight import models\n'),
+                    ('tests/test_views.py', 'from ..views import home\n')):
+                with open(os.path.join(root, 'knight', name), 'w') as f:
+                    f.write(content)
+
+            # no green run yet, all the tests are run
+            test.main('cheeseshop.development', 'knight', paths=[root],
+                      location=location)
+            self.assertEqual(execute_from_command_line.call_args[0],
+                             (['test', 'test', 'knight'],))
+
+            models = os.path.join(root, 'knight', 'models.py')
+            os.utime(models, (time.time() + 10, time.time() + 10))
+            test.main('cheeseshop.development', 'knight', paths=[root],
+                      location=location)
+            self.assertEqual(execute_from_command_line.call_args[0],
+                             (['test', 'test', 'knight.tests.test_models'],))
+        finally:
+            shutil.rmtree(root)
+
+    def test_override_settings(self):
+        # The databases and the slow settings are replaced at runtime
+        from djangorecipe import test
+        settings = mock.Mock(DATABASES={
+            'default': {'ENGINE': 'django.db.backends.postgresql',
+                        'NAME': 'cheeseshop',
+                        'TEST': {'DEPENDENCIES': []}}})
+        with mock.patch('django.conf.settings', settings):
+            test.override_settings('memory', True)
+        self.assertEqual(settings.DATABASES, {
+            'default': {'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': ':memory:',
+                        'TEST': {'DEPENDENCIES': [], 'NAME': ':memory:'}}})
+        self.assertEqual(settings.PASSWORD_HASHERS,
+                         ['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+    @mock.patch('djangorecipe.test.tmpfs_dir', lambda: '/dev/shm')
+    def test_override_settings_tmpfs(self):
+        from djangorecipe import test
+        settings = mock.Mock(DATABASES={'default': {'NAME': 'cheeseshop'}})
+        with mock.patch('django.conf.settings', settings):
+            test.override_settings('tmpfs')
+        name = settings.DATABASES['default']['NAME']
+        self.assertTrue(name.startswith('/dev/shm/'))
+        self.assertEqual(settings.DATABASES['default']['TEST']['NAME'], name)
+
+
+class TestTestDatabaseSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.app_dir = tempfile.mkdtemp('djangorecipe')
+        os.mkdir(os.path.join(self.app_dir, 'migrations'))
+        self.write('models.py', 'class Cheese(Model): pass\n')
+        self.write('views.py', '')
+        self.write(os.path.join('migrations', '0001_initial.py'), '')
+
+    def tearDown(self):
+        shutil.rmtree(self.app_dir)
+
+    def write(self, name, content):
+        with open(os.path.join(self.app_dir, name), 'w') as f:
+            f.write(content)
+
+    def test_snapshot_key(self):
+        # The snapshot key only depends on the models, migrations and
+        # fixtures of the applications
+        from djangorecipe.testdb import snapshot_key
+        key = snapshot_key([self.app_dir])
+        self.write('views.py', 'def home(request): pass\n')
+        self.assertEqual(snapshot_key([self.app_dir]), key)
+        self.write(os.path.join('migrations', '0002_cheese.py'), '')
+        self.assertNotEqual(snapshot_key([self.app_dir]), key)
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.report_dir = tempfile.mkdtemp('djangorecipe')
+
+    def tearDown(self):
+        shutil.rmtree(self.report_dir)
+
+    def run_tests(self, memory=False):
+        from djangorecipe.report import Recorder
+
+        class Knight(unittest.TestCase):
+            def test_ni(self):
+                pass
+
+            def test_shrubbery(self):
+                self.fail('a shrubbery')
+
+        recorder = Recorder(memory)
+        recorder.install()
+        try:
+            unittest.TestLoader().loadTestsFromTestCase(Knight).run(
+                unittest.TestResult())
+        finally:
+            recorder.uninstall()
+        return recorder
+
+    def test_json(self):
+        # Each test is recorded with its time, queries and outcome
+        recorder = self.run_tests()
+        path = os.path.join(self.report_dir, 'report.json')
+        with mock.patch('sys.stderr'):
+            recorder.write(path, 1)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual([(t['id'].rsplit('.', 1)[1], t['status'],
+                           t['queries']) for t in report['tests']],
+                         [('test_ni', 'passed', 0),
+                          ('test_shrubbery', 'failure', 0)])
+        self.assertEqual(len(report['classes']), 1)
+
+    def test_query_counter(self):
+        # The queries are counted per alias, and the cursor wrapper of the
+        # installed Django is restored afterwards
+        from djangorecipe.queries import QueryCounter, cursor_wrapper
+        wrapper = cursor_wrapper()
+        original = wrapper.__dict__.get('execute')
+        counter = QueryCounter()
+        counter.install()
+        try:
+            cursor = wrapper(mock.MagicMock(),
+                             mock.MagicMock(alias='default'))
+            cursor.execute('SELECT 1')
+        finally:
+            counter.uninstall()
+        self.assertEqual(counter.stats['default'][0], 1)
+        self.assertEqual(wrapper.__dict__.get('execute'), original)
+
+    def test_memory(self):
+        # The allocations are only traced on request
+        recorder = self.run_tests()
+        stats = list(recorder.classes.values())[0]
+        self.assertFalse('peak_memory' in stats)
+        if sys.platform != 'win32':
+            self.assertTrue(stats['max_rss_increase'] >= 0)
+
+        try:
+            import tracemalloc
+        except ImportError:
+            return
+        recorder = self.run_tests(memory=True)
+        self.assertTrue(list(recorder.classes.values())[0]['peak_memory'] > 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_junit(self):
+        from xml.etree import ElementTree
+        recorder = self.run_tests()
+        path = os.path.join(self.report_dir, 'report.xml')
+        recorder.write(path, 0)
+        suite = ElementTree.parse(path).getroot()
+        self.assertEqual((suite.get('tests'), suite.get('failures')),
+                         ('2', '1'))
+        self.assertEqual([case.get('name') for case in suite
+                          if case.find('failure') is not None],
+                         ['test_shrubbery'])
+
+
+class TestImportTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp('djangorecipe')
+        os.mkdir(os.path.join(self.path, 'parrot'))
+        for name, content in (('__init__.py', 'from parrot import dead\n'),
+                              ('dead.py', 'import time\n')):
+            with open(os.path.join(self.path, 'parrot', name), 'w') as f:
+                f.write(content)
+        sys.path.insert(0, self.path)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        for name in ('parrot', 'parrot.dead'):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.path)
+
+    def test_trace(self):
+        # The imports are timed in a tree, with the path entry they come from
+        if sys.version_info < (3, 4):
+            # the tracer relies on the module specs
+            return
+        from djangorecipe.importtrace import ImportTracer
+        tracer = ImportTracer()
+        sys.meta_path.insert(0, tracer)
+        try:
+            import parrot
+        finally:
+            sys.meta_path.remove(tracer)
+        self.assertEqual(parrot.__loader__.__class__.__name__,
+                         'SourceFileLoader')
+        [node] = tracer.root.children
+        self.assertEqual((node.name, node.entry), ('parrot', self.path))
+        self.assertEqual([child.name for child in node.children],
+                         ['parrot.dead'])
+        report_path = os.path.join(self.path, 'trace.txt')
+        tracer.write(report_path)
+        with open(report_path) as f:
+            self.assertTrue('  parrot.dead  (%s)' % self.path in f.read())
+
+
+class TestPth(unittest.TestCase):
+
+    def setUp(self):
+        self.sitedir = tempfile.mkdtemp('djangorecipe')
+        os.mkdir(os.path.join(self.sitedir, 'libs'))
+        self.pth_file = os.path.join(self.sitedir, 'libs.pth')
+        with open(self.pth_file, 'w') as f:
+            f.write('libs\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.sitedir)
+
+    def test_expand_cache(self):
+        # The .pth files are only parsed again when they change
+        from djangorecipe import pth
+        paths = [self.sitedir, os.path.join(self.sitedir, 'libs')]
+        self.assertEqual(pth.expand(self.sitedir), paths)
+        with mock.patch('djangorecipe.pth.parse') as parse:
+            self.assertEqual(pth.expand(self.sitedir), paths)
+            self.assertFalse(parse.called)
+            os.utime(self.pth_file, (time.time() + 10, time.time() + 10))
+            pth.expand(self.sitedir)
+            self.assertTrue(parse.called)
+
+
+class TestPathOrder(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        for entry, names in (('a', ['spam.py']),
+                             ('b', ['eggs.py']),
+                             ('c', ['spam.py', 'ham.py'])):
+            os.mkdir(os.path.join(self.root, entry))
+            for name in names:
+                with open(os.path.join(self.root, entry, name), 'w') as f:
+                    f.write('\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def entries(self, *names):
+        return [os.path.join(self.root, name) for name in names]
+
+    def test_reorder(self):
+        # The most used entries come first, but the entries providing the
+        # same name keep their order
+        from djangorecipe.pathorder import reorder
+        path = self.entries('a', 'b', 'c')
+        usage = {path[2]: ['ham']}
+        self.assertEqual(reorder(path, usage), self.entries('a', 'c', 'b'))
+        usage = {path[1]: ['eggs', 'eggs.spam']}
+        self.assertEqual(reorder(path, usage), self.entries('b', 'a', 'c'))
+
+    def test_record(self):
+        # The entries of the loaded modules are recorded
+        from djangorecipe import pathorder
+        from djangorecipe.templating import load_json
+        profile_path = os.path.join(self.root, 'parts', 'profile.json')
+        sys.path.insert(0, os.path.join(self.root, 'b'))
+        try:
+            import eggs
+            pathorder.record(profile_path)
+        finally:
+            sys.path.pop(0)
+            sys.modules.pop('eggs', None)
+        self.assertEqual(load_json(profile_path)[
+            os.path.join(self.root, 'b')], ['eggs'])
+
+
+class TestBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        self.entry = os.path.join(self.root, 'entry')
+        os.makedirs(os.path.join(self.entry, 'shrubbery'))
+        os.makedirs(os.path.join(self.entry, 'parts'))
+        for name, content in (('shrubbery/__init__.py', 'HEIGHT = 2\n'),
+                              ('shrubbery/native.so', ''),
+                              ('parts/ignored.py', '')):
+            with open(os.path.join(self.entry, name), 'w') as f:
+                f.write(content)
+        self.archive = os.path.join(self.root, 'django.pyz')
+
+    def tearDown(self):
+        sys.modules.pop('shrubbery', None)
+        shutil.rmtree(self.root)
+
+    def test_build(self):
+        # The packages of the path entries are bundled with their bytecode,
+        # and the bundle is only rebuilt when they change
+        import zipfile
+        from djangorecipe import bundle
+        self.assertTrue(bundle.build(self.archive, [self.entry],
+                                     [('__main__.py', '')]))
+        self.assertFalse(bundle.build(self.archive, [self.entry],
+                                      [('__main__.py', '')]))
+        names = zipfile.ZipFile(self.archive).namelist()
+        self.assertEqual(sorted(names),
+                         ['__main__.py', 'bundle.json',
+                          'lib/0/shrubbery/__init__.py',
+                          'lib/0/shrubbery/__init__.pyc',
+                          'lib/0/shrubbery/native.so'])
+
+        sys.path.insert(0, os.path.join(self.archive, 'lib', '0'))
+        try:
+            import shrubbery
+        finally:
+            sys.path.pop(0)
+        self.assertEqual(shrubbery.HEIGHT, 2)
+        self.assertTrue(shrubbery.__file__.endswith('.pyc'))
+
+    def test_activate(self):
+        # The entries with native extensions are extracted once
+        from djangorecipe import bundle
+        bundle.build(self.archive, [self.entry], [])
+        bundled = os.path.join(self.archive, 'lib', '0')
+        cache_dir = os.path.join(self.root, 'cache')
+        with mock.patch('sys.path', [bundled]):
+            [path] = bundle.activate(self.archive, cache_dir)
+            self.assertEqual(sys.path, [path])
+        self.assertTrue(os.path.exists(
+            os.path.join(path, 'shrubbery', 'native.so')))
+
+    def test_load_json(self):
+        # The manifest of a bundle, like the other JSON files, is None when
+        # it can not be read
+        from djangorecipe import bundle
+        from djangorecipe.templating import load_json
+        bundle.build(self.archive, [self.entry], [])
+        self.assertEqual(load_json(self.archive, member='bundle.json')[
+            'native'], [0])
+        self.assertEqual(load_json(self.archive, member='missing.json'), None)
+        self.assertEqual(load_json(os.path.join(self.root, 'missing.json'),
+                                   {}), {})
+        path = os.path.join(self.entry, 'shrubbery', '__init__.py')
+        self.assertEqual(load_json(path), None)
+        self.assertEqual(load_json(path, member='bundle.json'), None)
+
+
+class TestStatic(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        self.source = os.path.join(self.root, 'site.css')
+        with open(self.source, 'w') as f:
+            f.write('body { color: red; }\n' * 20)
+        self.target = os.path.join(self.root, 'static', 'css', 'site.css')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_collect_file(self):
+        # Files are only copied when their content changes, with their
+        # compressed variants
+        import gzip
+        from djangorecipe.static import collect_file
+        entry = collect_file(self.source, self.target, None, True)
+        self.assertTrue(entry['copied'])
+        with open(self.target + '.gz', 'rb') as f:
+            self.assertEqual(gzip.GzipFile(fileobj=f).read(),
+                             b'body { color: red; }\n' * 20)
+
+        entry = collect_file(self.source, self.target, entry, True)
+        self.assertFalse(entry['copied'])
+        os.utime(self.source, (time.time() + 10, time.time() + 10))
+        entry = collect_file(self.source, self.target, entry, True)
+        self.assertFalse(entry['copied'])
+
+        with open(self.source, 'a') as f:
+            f.write('p { color: blue; }\n')
+        entry = collect_file(self.source, self.target, entry, True)
+        self.assertTrue(entry['copied'])
+
+    def test_run_pool(self):
+        from djangorecipe.static import run_pool
+        self.assertEqual(run_pool(lambda i: i * 2, range(20), 4),
+                         [i * 2 for i in range(20)])
+        self.assertRaises(ZeroDivisionError, run_pool, lambda i: 1 / i,
+                          range(5), 2)
+
+    @mock.patch('django.contrib.staticfiles.finders.get_finders')
+    def test_find_files_without_app_configs(self, get_finders):
+        # Django < 1.7 has no application registry, the default ignore
+        # patterns are used
+        from djangorecipe.static import default_ignore_patterns, find_files
+        finder = mock.Mock()
+        finder.list.return_value = [('css/site.css',
+                                     mock.Mock(prefix=None))]
+        finder.list.return_value[0][1].path.return_value = self.source
+        get_finders.return_value = [finder]
+        with mock.patch.dict(sys.modules, {'django.apps': None}):
+            self.assertEqual(find_files(), {'css/site.css': self.source})
+        finder.list.assert_called_with(default_ignore_patterns)
+
+
+class TestMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        self.lc_messages = os.path.join(self.root, 'app', 'locale', 'nl',
+                                        'LC_MESSAGES')
+        os.makedirs(self.lc_messages)
+        os.makedirs(os.path.join(self.root, 'parts', 'locale', 'de',
+                                 'LC_MESSAGES'))
+        for path in (os.path.join(self.lc_messages, 'django.po'),
+                     os.path.join(self.lc_messages, 'djangojs.po'),
+                     os.path.join(self.root, 'parts', 'locale', 'de',
+                                  'LC_MESSAGES', 'django.po')):
+            with open(path, 'w') as f:
+                f.write('msgid ""\nmsgstr ""\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_find_catalogs(self):
+        # Only the catalogs without an up to date .mo file are compiled
+        from djangorecipe.messages import find_catalogs
+        po = os.path.join(self.lc_messages, 'django.po')
+        js_po = os.path.join(self.lc_messages, 'djangojs.po')
+        excluded = [os.path.join(self.root, 'parts')]
+        self.assertEqual(find_catalogs([self.root], excluded),
+                         [(po, po[:-3] + '.mo'), (js_po, js_po[:-3] + '.mo')])
+
+        with open(po[:-3] + '.mo', 'w') as f:
+            f.write('')
+        self.assertEqual(find_catalogs([self.root, self.root], excluded),
+                         [(js_po, js_po[:-3] + '.mo')])
+        os.utime(po, (time.time() + 10, time.time() + 10))
+        self.assertEqual(len(find_catalogs([self.root], excluded)), 2)
+
+    @mock.patch('subprocess.Popen')
+    def test_compile_messages(self, popen):
+        from djangorecipe.messages import compile_messages
+        popen.return_value.communicate.return_value = (b'', b'')
+        popen.return_value.returncode = 0
+        results = compile_messages([os.path.join(self.root, 'app')])
+        self.assertEqual([po for po, duration, error in results],
+                         [os.path.join(self.lc_messages, 'django.po'),
+                          os.path.join(self.lc_messages, 'djangojs.po')])
+        self.assertEqual(popen.call_args[0][0][:3],
+                         ['msgfmt', '--check-format', '-o'])
+
+        popen.return_value.communicate.return_value = (b'', b'syntax error')
+        popen.return_value.returncode = 1
+        results = compile_messages([os.path.join(self.root, 'app')])
+        self.assertEqual(results[0][2], 'syntax error')
+
+
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        for directory in ('first', 'second'):
+            os.makedirs(os.path.join(self.root, directory, 'app'))
+            for name in ('app/base.html', 'app/.hidden.html', 'index.html~'):
+                with open(os.path.join(self.root, directory, name), 'w') as f:
+                    f.write('{{ title }}')
+        with open(os.path.join(self.root, 'second', 'app', 'detail.html'),
+                  'w') as f:
+            f.write('{% if %}')
+        with open(os.path.join(self.root, 'second', 'app', 'logo.png'),
+                  'wb') as f:
+            f.write(b'\x89PNG\r\n')
+        with open(os.path.join(self.root, 'second', 'app', 'latin1.txt'),
+                  'wb') as f:
+            f.write(b'caf\xe9')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    @mock.patch('djangorecipe.templates.template_dirs')
+    def test_find_templates(self, template_dirs):
+        # The first template found for a name wins, as with the loaders, and
+        # only the files with a template extension are compiled
+        from djangorecipe.templates import find_templates
+        engine = mock.Mock()
+        template_dirs.return_value = [
+            (engine, os.path.join(self.root, 'first')),
+            (engine, os.path.join(self.root, 'second'))]
+        self.assertEqual(find_templates(), [
+            (engine, 'app/base.html',
+             os.path.join(self.root, 'first', 'app', 'base.html')),
+            (engine, 'app/detail.html',
+             os.path.join(self.root, 'second', 'app', 'detail.html')),
+            (engine, 'app/latin1.txt',
+             os.path.join(self.root, 'second', 'app', 'latin1.txt'))])
+        self.assertEqual([name for engine, name, path
+                          in find_templates(('.PNG',))], ['app/logo.png'])
+
+    def test_loader_dirs(self):
+        # The directories of explicitly configured loaders are found, those
+        # of the loaders wrapped by the cached loader included
+        from djangorecipe.templates import loader_dirs
+        filesystem = mock.Mock(spec=['get_dirs'])
+        filesystem.get_dirs.return_value = [os.path.join(self.root, 'first')]
+        app_directories = mock.Mock(spec=['get_dirs'])
+        app_directories.get_dirs.return_value = [
+            os.path.join(self.root, 'second')]
+        cached = mock.Mock(spec=['loaders', 'get_dirs'])
+        cached.loaders = [filesystem, app_directories]
+        locmem = mock.Mock(spec=[])
+        self.assertEqual(loader_dirs([cached, locmem]),
+                         [os.path.join(self.root, 'first'),
+                          os.path.join(self.root, 'second')])
+
+    def test_compile_template(self):
+        from djangorecipe.templates import compile_template
+        engine = mock.Mock()
+        path = os.path.join(self.root, 'first', 'app', 'base.html')
+        status, compile_time, error = compile_template(
+            (engine, 'app/base.html', path))
+        self.assertEqual((status, error), ('ok', None))
+        engine.from_string.assert_called_with('{{ title }}')
+
+        engine.from_string.side_effect = ValueError('Unclosed tag')
+        status, compile_time, error = compile_template(
+            (engine, 'app/base.html', path))
+        self.assertEqual((status, error),
+                         ('error', 'ValueError: Unclosed tag'))
+
+        # files that are not text are skipped rather than failing the check
+        status, compile_time, error = compile_template(
+            (engine, 'app/latin1.txt',
+             os.path.join(self.root, 'second', 'app', 'latin1.txt')))
+        self.assertEqual(status, 'skipped')
+
+    def test_compile_templates(self):
+        # The templates are compiled by forked processes
+        from djangorecipe.templates import compile_templates
+        engine = mock.Mock()
+        templates = [(engine, 'app/base.html',
+                      os.path.join(self.root, directory, 'app', 'base.html'))
+                     for directory in ('first', 'second')]
+        self.assertEqual([status for status, compile_time, error
+                          in compile_templates(templates, 2)],
+                         ['ok', 'ok'])
+
+    def test_warm_up_without_templates(self):
+        from djangorecipe.templates import warm_up
+        self.assertEqual(warm_up(os.path.join(self.root, 'missing.json')), 0)
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp('djangorecipe')
+        os.mkdir(os.path.join(self.root, 'knight'))
+        self.write('__init__.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name):
+        with open(os.path.join(self.root, 'knight', name), 'w') as f:
+            f.write('\n')
+
+    def test_inotify(self):
+        if not sys.platform.startswith('linux'):
+            # inotify is only available on Linux
+            return
+        from djangorecipe.watch import Inotify
+        watcher = Inotify([os.path.join(self.root, 'knight')])
+        self.write('models.py')
+        self.assertTrue(os.path.join(self.root, 'knight', 'models.py')
+                        in watcher.changes(1))
+        os.close(watcher.fd)
+
+    def test_poller(self):
+        from djangorecipe.watch import Poller
+        watcher = Poller([self.root])
+        self.write('models.py')
+        self.assertEqual(watcher.changes(0),
+                         [os.path.join(self.root, 'knight', 'models.py')])
+        self.assertEqual(watcher.changes(0), [])
+
 
 class TestManageScript(ScriptTestCase):
 
@@ -73,6 +682,104 @@ class TestManageScript(ScriptTestCase):
             mock_setdefault.call_args,
             (('DJANGO_SETTINGS_MODULE', 'cheeseshop.development'), {}))
 
+    @mock.patch('django.core.management.execute_from_command_line')
+    @mock.patch('os.environ.setdefault')
+    @mock.patch('djangorecipe.commands.use_index')
+    def test_script_command_index(self, use_index, mock_setdefault,
+                                  mock_execute):
+        # The control script can dispatch commands from a prebuilt index
+        from djangorecipe import manage
+        manage.main('cheeseshop.development', command_index='/commands.json')
+        self.assertEqual(use_index.call_args,
+                         (('/commands.json', sys.argv), {}))
+        self.assertTrue(mock_execute.called)
+
+    @mock.patch('django.core.management.execute_from_command_line')
+    @mock.patch('os.environ.setdefault')
+    @mock.patch('djangorecipe.profiling.profile')
+    @mock.patch('sys.argv', ['django', '--profile', 'migrate'])
+    def test_script_profile(self, profile, mock_setdefault, mock_execute):
+        # With --profile, the command is run under the profiler
+        from djangorecipe import manage
+        manage.main('cheeseshop.development', profile='/profiles')
+        self.assertEqual(profile.call_args[0][1:],
+                         (['django', 'migrate'], '/profiles'))
+        self.assertFalse(mock_execute.called)
+        profile.call_args[0][0]()
+        self.assertEqual(mock_execute.call_args,
+                         ((['django', 'migrate'],), {}))
+
+    @mock.patch('django.core.management.execute_from_command_line')
+    @mock.patch('os.environ.setdefault')
+    @mock.patch('djangorecipe.profiling.profile')
+    @mock.patch('djangorecipe.commands.use_index')
+    @mock.patch('sys.argv', ['django', '--profile', 'migrate'])
+    def test_script_profile_command_index(self, use_index, profile,
+                                          mock_setdefault, mock_execute):
+        # The profiling flag is removed before the subcommand is looked up
+        from djangorecipe import manage
+        manage.main('cheeseshop.development', command_index='/commands.json')
+        self.assertEqual(use_index.call_args,
+                         (('/commands.json', ['django', 'migrate']), {}))
+        self.assertTrue(profile.called)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_profile(self):
+        # The stats are dumped to the directory, with a summary
+        from djangorecipe import profiling
+        directory = tempfile.mkdtemp('djangorecipe')
+        try:
+            stream = mock.Mock()
+            result = profiling.profile(lambda: 42, ['django', 'migrate'],
+                                       directory, stream)
+            self.assertEqual(result, 42)
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].startswith('migrate-'))
+            self.assertTrue(files[0].endswith('.pstats'))
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCommandIndex(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.index_path = tempfile.mkstemp('.json')
+        os.close(fd)
+        with open(self.index_path, 'w') as f:
+            json.dump({'key': 'k', 'apps': ['cheeseshop'],
+                       'commands': {'shell': 'django.core',
+                                    'stilton': 'cheeseshop'}}, f)
+
+    def tearDown(self):
+        os.remove(self.index_path)
+
+    def use_index(self, argv, installed_apps=('cheeseshop',)):
+        from djangorecipe.commands import use_index
+        settings = mock.Mock(INSTALLED_APPS=list(installed_apps))
+        with mock.patch('django.conf.settings', settings):
+            return use_index(self.index_path, argv)
+
+    def test_use_index(self):
+        # Known commands are dispatched from the index
+        from django.core import management
+        with mock.patch.object(management, 'get_commands'):
+            self.assertTrue(self.use_index(['django', 'stilton']))
+            self.assertEqual(management.get_commands(),
+                             {'shell': 'django.core',
+                              'stilton': 'cheeseshop'})
+
+    def test_use_index_unknown_command(self):
+        # Unknown commands are left to Django's discovery
+        self.assertFalse(self.use_index(['django', 'tilsit']))
+
+    def test_use_index_stale(self):
+        # The index is not used when the installed applications changed
+        self.assertFalse(self.use_index(['django', 'stilton'],
+                                        ('cheeseshop', 'nce')))
+
 
 class TestWSGIScript(ScriptTestCase):
 
@@ -88,3 +795,73 @@ class TestWSGIScript(ScriptTestCase):
                 from djangorecipe import wsgi
                 wsgi.main(settings_dotted_path, logfile=None)
                 self.assertTrue(patched_method.called)
+
+
+class TestASGIScript(ScriptTestCase):
+    # django.core.asgi is only available from Django 3.0
+
+    def asgi_available(self):
+        try:
+            import django.core.asgi
+        except ImportError:
+            return False
+        return True
+
+    def test_script(self):
+        if not self.asgi_available():
+            return
+        settings_dotted_path = 'cheeseshop.development'
+        with mock.patch('os.environ',
+                        {'DJANGO_SETTINGS_MODULE': settings_dotted_path}):
+            with mock.patch('django.core.asgi.get_asgi_application') \
+                 as patched_method:
+                from djangorecipe import asgi
+                asgi.main(settings_dotted_path, logfile=None)
+                self.assertTrue(patched_method.called)
+
+    @mock.patch('djangorecipe.asgi.redirect_output')
+    def test_logfile(self, redirect_output):
+        if not self.asgi_available():
+            return
+        with mock.patch('os.environ', {}):
+            with mock.patch('django.core.asgi.get_asgi_application'):
+                from djangorecipe import asgi
+                asgi.main('cheeseshop.development', logfile='/foo')
+        redirect_output.assert_called_with('/foo')
+
+
+class TestSettingsSnapshot(unittest.TestCase):
+
+    def test_is_stale(self):
+        # A snapshot is stale as soon as one of its source files changes
+        from djangorecipe.snapshot import is_stale
+        from djangorecipe.templating import checksum
+        fd, path = tempfile.mkstemp('.py')
+        os.close(fd)
+        try:
+            with open(path, 'w') as f:
+                f.write('DEBUG = True\n')
+            checksums = {path: checksum(path)}
+            self.assertFalse(is_stale(checksums))
+            with open(path, 'w') as f:
+                f.write('DEBUG = False\n')
+            self.assertTrue(is_stale(checksums))
+        finally:
+            os.remove(path)
+
+    def test_freeze_private(self):
+        # The snapshot holds the secrets of the settings, only its owner can
+        # read it
+        from djangorecipe.snapshot import freeze
+        root = tempfile.mkdtemp('djangorecipe')
+        sys.path.insert(0, root)
+        try:
+            with open(os.path.join(root, 'gouda_settings.py'), 'w') as f:
+                f.write("SECRET_KEY = 'gouda'\n")
+            target = os.path.join(root, 'snapshot.py')
+            self.assertEqual(freeze('gouda_settings', target), 0)
+            self.assertEqual(os.stat(target).st_mode & 0o777, 0o600)
+        finally:
+            sys.path.remove(root)
+            sys.modules.pop('gouda_settings', None)
+            shutil.rmtree(root)
@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import sys
@@ -114,20 +115,30 @@ class TestRecipe(BaseTestRecipe):
 
     @mock.patch('zc.recipe.egg.egg.Scripts.working_set',
                 return_value=(None, []))
-    @mock.patch('site.addsitedir', return_value=['extra', 'dirs'])
-    def test_pth_files(self, addsitedir, working_set):
+    @mock.patch('djangorecipe.recipe.Recipe.create_manage_script')
+    def test_pth_files(self, manage, working_set):
 
         # When a pth-files option is set the recipe will use that to add more
         # paths to extra-paths.
         self.recipe.options['version'] = '1.0'
 
-        # The mock values needed to demonstrate the pth-files option.
-        self.recipe.options['pth-files'] = 'somedir'
+        # The .pth files of the directory are parsed, their import lines are
+        # not run and the missing directories are dropped
+        sitedir = os.path.join(self.buildout_dir, 'somedir')
+        os.makedirs(os.path.join(sitedir, 'extra'))
+        os.makedirs(os.path.join(sitedir, 'dirs'))
+        with open(os.path.join(sitedir, 'libs.pth'), 'w') as f:
+            f.write('# libraries\nextra\nimport spam\nmissing\ndirs\n'
+                    'extra\n')
+        self.recipe.options['pth-files'] = sitedir
         self.recipe.install()
 
-        self.assertEqual(addsitedir.call_args, (('somedir', set([])), {}))
-        # The extra-paths option has been extended.
-        self.assertEqual(self.recipe.options['extra-paths'], '\nextra\ndirs')
+        self.assertEqual(manage.call_args[0][0][-3:],
+                         [sitedir, os.path.join(sitedir, 'extra'),
+                          os.path.join(sitedir, 'dirs')])
+        self.assertTrue('spam' not in sys.modules)
+        # The extra-paths option is left unchanged.
+        self.assertEqual(self.recipe.options['extra-paths'], '')
 
     def test_settings_option(self):
         # The settings option can be used to specify the settings file
@@ -161,6 +172,193 @@ class TestRecipe(BaseTestRecipe):
         self.assertTrue(set(os.listdir(temp_path)). \
             issubset(os.listdir(project_dir)))
 
+    @mock.patch('zc.recipe.egg.egg.Scripts.working_set',
+                return_value=(None, []))
+    def test_dry_run(self, working_set):
+        # In dry-run mode, the template is only rendered in memory and the
+        # project directory is left untouched
+        self.recipe.options['dry-run'] = 'true'
+        with mock.patch.object(self.recipe.log, 'info') as info:
+            self.recipe.install()
+        self.assertFalse(
+            os.path.exists(os.path.join(self.buildout_dir, 'project')))
+        self.assertTrue([c for c in info.call_args_list
+                         if c[0][0].startswith('Dry run: 4 files')])
+
+    def test_dry_run_conflicts(self):
+        # The entries that already exist are not listed as created, nor
+        # counted in the totals
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        os.makedirs(project_dir)
+        with open(os.path.join(project_dir, 'settings.py'), 'w') as f:
+            f.write('')
+        with mock.patch.object(self.recipe.log, 'info') as info:
+            with mock.patch.object(self.recipe.log, 'warning') as warning:
+                self.recipe.preview_project(project_dir)
+        created = [c[0][0] for c in info.call_args_list
+                   if c[0][0].startswith('Would create')]
+        self.assertFalse([m for m in created if m.endswith('settings.py')])
+        self.assertEqual(len(created), 3)
+        self.assertTrue(info.call_args[0][0].startswith(
+            'Dry run: 3 files'))
+        self.assertTrue('settings.py already exists' in
+                        warning.call_args[0][0])
+
+    @mock.patch('zc.recipe.egg.egg.Scripts.working_set',
+                return_value=(None, []))
+    def test_dry_run_update(self, working_set):
+        # The project files are not upgraded by a dry run
+        self.recipe.options['dry-run'] = 'true'
+        with mock.patch.object(self.recipe, 'upgrade_project') as upgrade:
+            self.recipe.update()
+        self.assertFalse(upgrade.called)
+
+    @mock.patch('zc.recipe.egg.egg.Scripts.working_set',
+                return_value=(None, []))
+    def test_timings(self, working_set):
+        # The duration of each phase can be written to the part directory
+        self.recipe.options['timings'] = 'true'
+        with mock.patch.object(self.recipe.log, 'info'):
+            paths = self.recipe.install()
+        timings_path = os.path.join(self.parts_dir, 'django', 'timings.json')
+        self.assertTrue(timings_path in paths)
+        with open(timings_path) as f:
+            timings = json.load(f)
+        self.assertEqual([p['phase'] for p in timings['phases']],
+                         ['extra-paths', 'working-set', 'project',
+                          'manage-script', 'test-runner', 'wsgi-script'])
+
+    @mock.patch('sys.stdout')
+    def test_dry_run_diff(self, stdout):
+        # A unified diff against an existing project can be emitted
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        self.recipe.create_project(project_dir)
+        with open(os.path.join(project_dir, 'urls.py'), 'a') as f:
+            f.write('# local change\n')
+
+        self.recipe.options['dry-run-diff'] = 'true'
+        self.recipe.preview_project(project_dir)
+        diff = ''.join(''.join(c[0][0]) for c in
+                       stdout.writelines.call_args_list)
+        self.assertTrue('-# local change' in diff)
+        # the settings are rendered with the secret of the project
+        self.assertFalse('SECRET_KEY' in diff)
+
+    def test_dry_run_size(self):
+        # The size of the files is reported in bytes
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        with mock.patch('djangorecipe.recipe.render_tree',
+                        return_value=[('caf\xe9.txt', u'caf\xe9\n')]):
+            with mock.patch.object(self.recipe.log, 'info') as info:
+                self.recipe.preview_project(project_dir)
+        self.assertTrue(info.call_args[0][0].startswith(
+            'Dry run: 1 files, 6 bytes'))
+
+    def test_create_project_production_template(self):
+        # The production template is bundled with the recipe, and its
+        # settings can be tuned with recipe options
+        self.recipe.options['template'] = 'production'
+        self.recipe.options['conn_max_age'] = '60'
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        self.recipe.create_project(project_dir)
+
+        settings = open(os.path.join(project_dir, 'settings.py')).read()
+        self.assertTrue("'CONN_MAX_AGE': 60," in settings)
+        self.assertTrue("'django.template.loaders.cached.Loader'" in settings)
+        self.assertTrue("'BACKEND': 'django.core.cache.backends.locmem."
+                        "LocMemCache'" in settings)
+
+    def test_settings_snapshot(self):
+        # The settings module can be frozen at build time in a snapshot
+        # module that the generated scripts use instead
+        recipe_dir = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), '..', '..'))
+        self.recipe.create_project(os.path.join(self.buildout_dir, 'project'))
+        settings_path = os.path.join(self.buildout_dir, 'project',
+                                     'development.py')
+        with open(settings_path, 'w') as f:
+            f.write('import os\nDEBUG = True\nDATABASES = {}\n')
+
+        extra_paths = [self.buildout_dir, recipe_dir]
+        paths = self.recipe.create_settings_snapshot(extra_paths, [])
+        self.assertEqual(self.recipe.get_settings_module(),
+                         'development_snapshot')
+        self.assertEqual(extra_paths[-1], self.recipe.options['location'])
+
+        self.recipe.create_manage_script(extra_paths, [])
+        self.assertTrue("djangorecipe.manage.main('development_snapshot')"
+                        in script_cat(self.bin_dir, 'django'))
+
+        snapshot = open(paths[0]).read()
+        self.assertTrue('    DEBUG = True' in snapshot)
+        self.assertTrue('from project.development import *' in snapshot)
+        self.assertTrue(settings_path in snapshot)
+
+    def test_settings_snapshot_non_literal(self):
+        # Settings that can not be written as literals prevent the snapshot
+        recipe_dir = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), '..', '..'))
+        self.recipe.create_project(os.path.join(self.buildout_dir, 'project'))
+        with open(os.path.join(self.buildout_dir, 'project',
+                               'development.py'), 'w') as f:
+            f.write('LOADER = object()\n')
+
+        self.assertEqual(self.recipe.create_settings_snapshot(
+            [self.buildout_dir, recipe_dir], []), [])
+        self.assertEqual(self.recipe.get_settings_module(),
+                         'project.development')
+
+    def test_upgrade_project(self):
+        # The files rendered from a template are recorded so that they can be
+        # upgraded when the template changes, unless they were modified
+        template_dir = os.path.join(self.buildout_dir, 'templates', 'house')
+        os.makedirs(template_dir)
+        for name in ('settings.py', 'urls.py'):
+            with open(os.path.join(template_dir, name), 'w') as f:
+                f.write('# ${project_name} %s v1\n' % name)
+        self.recipe.buildout['djangorecipe'] = {
+            'template-dirs': os.path.dirname(template_dir)}
+        self.recipe.options['template'] = 'house'
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        self.recipe.create_project(project_dir)
+
+        with open(os.path.join(project_dir, 'urls.py'), 'a') as f:
+            f.write('# local change\n')
+        for name in ('settings.py', 'urls.py'):
+            with open(os.path.join(template_dir, name), 'w') as f:
+                f.write('# ${project_name} %s v2\n' % name)
+
+        # Upgrades only happen on request
+        self.recipe.upgrade_project(project_dir)
+        self.assertEqual(open(os.path.join(project_dir, 'settings.py')).read(),
+                         '# project settings.py v1\n')
+
+        self.recipe.options['upgrade-project'] = 'true'
+        self.recipe.upgrade_project(project_dir)
+        self.assertEqual(open(os.path.join(project_dir, 'settings.py')).read(),
+                         '# project settings.py v2\n')
+        self.assertEqual(open(os.path.join(project_dir, 'urls.py')).read(),
+                         '# project urls.py v1\n# local change\n')
+
+    def test_manifest_rendered_names(self):
+        # The entries with replacement strings in their name are recorded
+        # under their rendered name, and the manifest is kept private
+        template_dir = os.path.join(self.buildout_dir, 'templates', 'house')
+        os.makedirs(os.path.join(template_dir, '${project_name}'))
+        for name in ('settings.py', os.path.join('${project_name}',
+                                                 'mod.py')):
+            with open(os.path.join(template_dir, name), 'w') as f:
+                f.write('# $secret\n')
+        self.recipe.buildout['djangorecipe'] = {
+            'template-dirs': os.path.dirname(template_dir)}
+        self.recipe.options['template'] = 'house'
+        self.recipe.create_project(os.path.join(self.buildout_dir,
+                                                'project'))
+        manifest_path = self.recipe.get_manifest_path()
+        self.assertEqual(sorted(self.recipe.read_manifest()['files']),
+                         [os.path.join('project', 'mod.py'), 'settings.py'])
+        if not is_win32:
+            self.assertEqual(os.stat(manifest_path).st_mode & 0o777, 0o600)
 
     @mock.patch('zc.recipe.egg.egg.Scripts.working_set',
                 return_value=(None, []))
@@ -239,14 +437,162 @@ class TestRecipeScripts(BaseTestRecipe):
         wsgi_script = script_path(self.bin_dir, 'foo-wsgi.py')
         self.assertTrue(os.path.exists(wsgi_script))
 
-    @mock.patch('zc.buildout.easy_install.scripts',
+    def test_make_protocol_script_asgi(self):
+        # An ASGI entry point can be generated along with the WSGI script,
+        # with the same paths and settings
+        self.recipe.options['wsgi'] = 'true'
+        self.recipe.options['asgi'] = 'true'
+        self.recipe.options['logfile'] = '/foo'
+        self.recipe.make_scripts([], [])
+        self.assertTrue(os.path.exists(script_path(self.bin_dir,
+                                                   'django.wsgi')))
+        contents = script_cat(self.bin_dir, 'django.asgi')
+        self.assertTrue("application = "
+                        "djangorecipe.asgi.main('project.development', "
+                        "logfile='/foo')"
+                        in contents)
+
+    def test_make_protocol_named_script_asgi(self):
+        self.recipe.options['asgi'] = 'true'
+        self.recipe.options['asgi-script'] = 'foo-asgi.py'
+        self.assertEqual(len(self.recipe.make_scripts([], [])), 1)
+        self.assertTrue(os.path.exists(script_path(self.bin_dir,
+                                                   'foo-asgi.py')))
+
+    @mock.patch('djangorecipe.recipe.Recipe.create_script',
                 return_value=['some-path'])
-    def test_make_protocol_scripts_return_value(self, scripts):
+    def test_make_protocol_scripts_return_value(self, create_script):
         # The return value of make scripts lists the generated scripts.
         self.recipe.options['wsgi'] = 'true'
         self.assertEqual(self.recipe.make_scripts([], []),
                          ['some-path'])
 
+    def test_multiple_settings(self):
+        # A part can create the scripts of several settings modules, the
+        # scripts of the additional ones are suffixed with their name
+        self.recipe.options['settings'] = 'development\nproduction'
+        self.recipe.options['test'] = 'knight'
+        self.recipe.options['wsgi'] = 'true'
+        self.recipe.create_scripts([], [])
+        for name in ('django', 'test', 'django.wsgi'):
+            self.assertTrue("'project.development'"
+                            in script_cat(self.bin_dir, name))
+        for name in ('django-production', 'test-production',
+                     'django-production.wsgi'):
+            self.assertTrue("'project.production'"
+                            in script_cat(self.bin_dir, name))
+
+    def test_create_bundle(self):
+        # The python path can be packed in a bundle, with a control script
+        # and a wsgi entry point
+        import zipfile
+        project_dir = os.path.join(self.buildout_dir, 'project')
+        self.recipe.create_project(project_dir)
+        paths = self.recipe.create_bundle([self.buildout_dir], [])
+        self.assertEqual(paths, [os.path.join(self.parts_dir, 'django',
+                                              'django.pyz')])
+        bundle = zipfile.ZipFile(paths[0])
+        self.assertTrue('lib/0/project/settings.pyc' in bundle.namelist())
+        main = bundle.read('__main__.py').decode('utf-8')
+        self.assertTrue("djangorecipe.manage.main('project.development')"
+                        in main)
+        self.assertTrue('application = djangorecipe.wsgi.main(' in
+                        bundle.read('bundle_wsgi.py').decode('utf-8'))
+
+    @mock.patch('djangorecipe.recipe.Recipe.run_task', return_value=0)
+    def test_collect_static(self, run_task):
+        # The static files can be collected at build time
+        from zc.buildout import UserError
+        self.recipe.options['collectstatic-compress'] = 'true'
+        self.assertEqual(self.recipe.collect_static([], []), [])
+        self.assertEqual(run_task.call_args[0][2:], (
+            'djangorecipe.static', 'collect',
+            "'project.development', %r, compressed=True, workers=8"
+            % os.path.join(self.parts_dir, 'django',
+                           'development_static.json')))
+
+        run_task.return_value = 1
+        self.assertRaises(UserError, self.recipe.collect_static, [], [])
+
+    @mock.patch('djangorecipe.messages.compile_messages')
+    def test_compile_messages(self, compile_messages):
+        # The message catalogs of the project and the extra-paths are
+        # compiled, without searching the directories of buildout
+        from zc.buildout import UserError
+        compile_messages.return_value = [('django.po', 0.1, None)]
+        self.recipe.buildout['buildout']['parts-directory'] = self.parts_dir
+        self.recipe.compile_messages([self.buildout_dir, '/extra'])
+        roots, excluded, workers = compile_messages.call_args[0]
+        self.assertEqual(roots, [os.path.join(self.buildout_dir, 'project'),
+                                 '/extra'])
+        self.assertTrue(self.parts_dir in excluded)
+        self.assertEqual(workers, 4)
+
+        compile_messages.return_value = [('django.po', 0.1, 'error')]
+        self.assertRaises(UserError, self.recipe.compile_messages, [])
+
+    @mock.patch('djangorecipe.recipe.Recipe.run_task', return_value=0)
+    def test_check_templates(self, run_task):
+        # The templates can be compiled at build time, and their names kept
+        # for the wsgi script
+        from zc.buildout import UserError
+        self.assertEqual(self.recipe.check_templates([], []), [])
+        self.assertEqual(run_task.call_args[0][2:], (
+            'djangorecipe.templates', 'check',
+            "'project.development', None, workers=8"))
+
+        self.recipe.options['template-warmup'] = 'true'
+        templates_path = os.path.join(self.parts_dir, 'django',
+                                      'development_templates.json')
+        self.assertEqual(self.recipe.check_templates([], []),
+                         [templates_path])
+        self.assertTrue(self.recipe.get_application_arguments().endswith(
+            ', templates=%r' % templates_path))
+
+        self.recipe.options['template-check-extensions'] = 'html .email'
+        self.recipe.check_templates([], [])
+        self.assertTrue(run_task.call_args[0][4].endswith(
+            ", extensions=('.html', '.email')"))
+
+        run_task.return_value = 1
+        self.assertRaises(UserError, self.recipe.check_templates, [], [])
+
+    def test_script_template_unchanged(self):
+        # The wsgi script is generated without replacing the script template
+        # of zc.buildout
+        import zc.buildout.easy_install
+        template = zc.buildout.easy_install.script_template
+        self.recipe.options['wsgi'] = 'true'
+        with mock.patch.object(self.recipe, 'create_script',
+                               side_effect=IOError):
+            self.assertRaises(IOError, self.recipe.make_scripts, [], [])
+        self.assertTrue(zc.buildout.easy_install.script_template is template)
+
+    def test_script_mode(self):
+        # The scripts are made executable without reading the umask, which
+        # would change it for the whole process
+        self.recipe.options['wsgi'] = 'true'
+        with mock.patch('os.umask') as umask:
+            scripts = self.recipe.make_scripts([], [])
+        self.assertFalse(umask.called)
+        if sys.platform != 'win32':
+            self.assertEqual(os.stat(scripts[0]).st_mode & 0o777, 0o755)
+
+    def test_shared_working_set(self):
+        # Sibling parts resolve their working set once
+        class Buildout(dict):
+            pass
+        buildout = Buildout(self.recipe.buildout)
+        self.recipe.buildout = buildout
+        with mock.patch.object(self.recipe.egg, 'working_set',
+                               return_value=([], [])) as working_set:
+            self.recipe.get_working_set()
+            sibling = Recipe(*self.recipe_initialisation)
+            sibling.buildout = buildout
+            sibling.egg = self.recipe.egg
+            sibling.get_working_set()
+        self.assertEqual(working_set.call_count, 1)
+
     def test_create_manage_script(self):
         # This buildout recipe creates a alternative for the standard
         # manage.py script. It has all the same functionality as the
@@ -267,6 +613,51 @@ class TestRecipeScripts(BaseTestRecipe):
         self.assertTrue("djangorecipe.manage.main('spameggs.development')"
                         in script_cat(manage))
 
+    @mock.patch('djangorecipe.recipe.Recipe.run_task', return_value=0)
+    def test_create_manage_script_command_index(self, run_task):
+        # The management commands can be indexed at build time, the index is
+        # then passed to the control script
+        paths = self.recipe.create_command_index([], [])
+        self.assertEqual(run_task.call_args[0][2:4],
+                         ('djangorecipe.commands', 'build_index'))
+        self.recipe.create_manage_script([], [])
+        self.assertTrue("command_index=%r" % paths[0]
+                        in script_cat(self.bin_dir, 'django'))
+
+    def test_create_manage_script_profile(self):
+        # The control script can profile every command
+        self.recipe.options['profile'] = 'true'
+        self.recipe.create_manage_script([], [])
+        self.assertTrue("profile=%r" % os.path.join(
+            self.parts_dir, 'django', 'profiles')
+            in script_cat(self.bin_dir, 'django'))
+
+    def test_create_manage_script_import_trace(self):
+        # The imports of the generated scripts can be traced
+        self.recipe.options['import-trace'] = 'true'
+        self.recipe.create_manage_script([], [])
+        self.assertTrue("importtrace.start(%r)" % os.path.join(
+            self.parts_dir, 'django', 'import-trace-django.txt')
+            in script_cat(self.bin_dir, 'django'))
+
+    def test_sys_path_order(self):
+        # The python path of the scripts is ordered by the recorded usage
+        self.recipe.options['sys-path-order'] = 'true'
+        entries = [os.path.realpath(os.path.join(self.buildout_dir, name))
+                   for name in ('cold', 'hot')]
+        for entry in entries:
+            os.mkdir(entry)
+        self.assertEqual(self.recipe.get_script_path(entries, []), entries)
+
+        with mock.patch('djangorecipe.recipe.load_json',
+                        return_value={entries[1]: ['spam']}):
+            self.assertEqual(self.recipe.get_script_path(entries, []),
+                             entries[::-1])
+            self.recipe.create_manage_script(entries, [])
+        self.assertTrue("path_profile=%r" % os.path.join(
+            self.parts_dir, 'django', 'path-profile.json')
+            in script_cat(self.bin_dir, 'django'))
+
     def test_create_manage_script_with_initialization(self):
         self.recipe.options['initialization'] = 'import os\nassert True'
         self.recipe.create_manage_script([], [])
@@ -308,6 +699,44 @@ class TestTesTRunner(BaseTestRecipe):
         self.recipe.create_test_runner([recipe_dir], [])
         self.assertTrue(os.path.exists(script_path(self.bin_dir, 'test')))
 
+    def test_create_test_runner_db_snapshot(self):
+        # The test runner can reuse a snapshot of the test database, stored
+        # in the part directory
+        self.recipe.options['test'] = 'knight'
+        self.recipe.options['test-db-snapshot'] = 'true'
+        self.recipe.create_test_runner([], [])
+        self.assertTrue("db_snapshot=%r" % os.path.join(
+            self.parts_dir, 'django', 'testdb')
+            in script_cat(self.bin_dir, 'test'))
+
+    def test_create_test_runner_report(self):
+        # The test runner can write a performance report of the test runs
+        self.recipe.options['test'] = 'knight'
+        self.recipe.options['test-report'] = 'test-report.xml'
+        self.recipe.create_test_runner([], [])
+        self.assertTrue("report=%r, report_top=10" % os.path.join(
+            self.buildout_dir, 'test-report.xml')
+            in script_cat(self.bin_dir, 'test'))
+        self.assertFalse('report_memory' in script_cat(self.bin_dir, 'test'))
+
+        self.recipe.options['test-report-memory'] = 'true'
+        self.recipe.create_test_runner([], [])
+        self.assertTrue("report_top=10, report_memory=True"
+                        in script_cat(self.bin_dir, 'test'))
+
+    def test_create_test_runner_database(self):
+        # The test runner can replace the databases and the slow settings
+        self.recipe.options['test'] = 'knight'
+        self.recipe.options['test-database'] = 'memory'
+        self.recipe.options['test-fast-settings'] = 'true'
+        self.recipe.create_test_runner([], [])
+        self.assertTrue("database='memory', fast_settings=True"
+                        in script_cat(self.bin_dir, 'test'))
+
+        from zc.buildout import UserError
+        self.recipe.options['test-database'] = 'ramdisk'
+        self.assertRaises(UserError, self.recipe.create_test_runner, [], [])
+
     def test_not_create_test_runner(self):
         recipe_dir = os.path.abspath(
             os.path.join(os.path.dirname(__file__), '..'))
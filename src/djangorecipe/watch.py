@@ -0,0 +1,209 @@
+"""
+Watch mode of the test runner: a warm interpreter with Django set up runs the
+tests affected by each change in a forked child
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+from djangorecipe import depgraph
+from djangorecipe.templating import make_dirs
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+event_header = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """
+    Reports the files changed in the watched directories through the Linux
+    inotify API
+    """
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+        IN_DELETE
+
+    def __init__(self, directories):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        for directory in directories:
+            self.add(directory)
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(
+            self.fd, directory.encode(sys.getfilesystemencoding()),
+            self.mask)
+        if wd >= 0:
+            self.watches[wd] = directory
+
+    def changes(self, timeout=None):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory,
+                                name.decode(sys.getfilesystemencoding()))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add(path)
+                continue
+            paths.append(path)
+        return paths
+
+
+class Poller(object):
+    """
+    Reports the modules changed in the watched directories by comparing their
+    modification times
+    """
+
+    def __init__(self, roots, interval=1.0):
+        self.roots = roots
+        self.interval = interval
+        self.mtimes = self.scan()
+
+    def scan(self):
+        mtimes = {}
+        for module, path in depgraph.module_files(self.roots):
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+        return mtimes
+
+    def changes(self, timeout=None):
+        time.sleep(timeout is None and self.interval or timeout)
+        mtimes = self.scan()
+        paths = [path for path in set(mtimes) | set(self.mtimes)
+                 if mtimes.get(path) != self.mtimes.get(path)]
+        self.mtimes = mtimes
+        return paths
+
+
+def create_watcher(roots):
+    """
+    Returns an inotify watcher where available, a poller otherwise
+    """
+    if sys.platform.startswith('linux'):
+        directories = set([r for r in roots if os.path.isdir(r)])
+        for module, path in depgraph.module_files(roots):
+            directories.add(os.path.dirname(path))
+        try:
+            return Inotify(sorted(directories))
+        except (AttributeError, OSError, TypeError):
+            pass
+    return Poller(roots)
+
+
+def wait_for_changes(watcher):
+    """
+    Blocks until python files change, and returns their paths
+    """
+    changed = set()
+    while not changed:
+        changed.update([p for p in watcher.changes() if p.endswith('.py')])
+    # let editors finish saving
+    while True:
+        more = watcher.changes(0.2)
+        if not more:
+            break
+        changed.update([p for p in more if p.endswith('.py')])
+    return sorted(changed)
+
+
+def loaded_files():
+    """
+    Returns the real paths of the source files of the loaded modules
+    """
+    files = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if path:
+            if path.endswith(('.pyc', '.pyo')):
+                path = path[:-1]
+            files.add(os.path.realpath(path))
+    return files
+
+
+def run_forked(run, labels):
+    """
+    Runs the tests in a child process, so that the parent stays warm and
+    unaffected by the test run
+    """
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            try:
+                run(labels)
+                code = 0
+            except SystemExit as e:
+                code = e.code or 0
+            except Exception:
+                traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return os.waitpid(pid, 0)[1]
+
+
+def watch(run, apps, paths, location):
+    """
+    Runs the tests of the apps, and then the tests affected by each change in
+    the paths. Django is set up once in this process. A change to a module it
+    loaded restarts the process
+    """
+    if not hasattr(os, 'fork'):
+        sys.stderr.write('The watch mode requires os.fork\n')
+        return 1
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    # warm up the test machinery shared by the children
+    import django.test.utils
+
+    make_dirs(location)
+    cache_path = os.path.join(location, 'depgraph.json')
+    depgraph.update_graph(paths, cache_path)
+    watcher = create_watcher(paths)
+
+    run_forked(run, list(apps))
+    while True:
+        sys.stdout.write('Watching for changes...\n')
+        sys.stdout.flush()
+        changed = wait_for_changes(watcher)
+        loaded = loaded_files()
+        if [p for p in changed if os.path.realpath(p) in loaded]:
+            sys.stdout.write('Loaded modules changed, restarting\n')
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        graph = depgraph.update_graph(paths, cache_path)
+        labels = depgraph.affected_tests(graph, changed, apps)
+        if labels:
+            sys.stdout.write('Running %s\n' % ' '.join(labels))
+            run_forked(run, labels)
@@ -2,31 +2,43 @@ import os
 import sys
 
 
-def main(settings_file, logfile=None):
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
-    if logfile:
-        import datetime
+def redirect_output(logfile):
+    # Send stdout and stderr to the log file, for servers that do not allow
+    # printing to them. Shared with the asgi entry point
+    import datetime
+
+    class logger(object):
+        def __init__(self, logfile):
+            self.logfile = logfile
 
-        class logger(object):
-            def __init__(self, logfile):
-                self.logfile = logfile
+        def write(self, data):
+            self.log(data)
 
-            def write(self, data):
-                self.log(data)
+        def writeline(self, data):
+            self.log(data)
 
-            def writeline(self, data):
-                self.log(data)
+        def log(self, msg):
+            line = '%s - %s\n' % (
+                datetime.datetime.now().strftime('%Y%m%d %H:%M:%S'), msg)
+            fp = open(self.logfile, 'a')
+            try:
+                fp.write(line)
+            finally:
+                fp.close()
+    sys.stdout = sys.stderr = logger(logfile)
 
-            def log(self, msg):
-                line = '%s - %s\n' % (
-                    datetime.datetime.now().strftime('%Y%m%d %H:%M:%S'), msg)
-                fp = open(self.logfile, 'a')
-                try:
-                    fp.write(line)
-                finally:
-                    fp.close()
-        sys.stdout = sys.stderr = logger(logfile)
+
+def main(settings_file, logfile=None, templates=None):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_file)
+    if logfile:
+        redirect_output(logfile)
 
     # Run WSGI handler for the application
     from django.core.wsgi import get_wsgi_application
-    return get_wsgi_application()
+    application = get_wsgi_application()
+    if templates:
+        # Fill the cached template loader with the templates checked at
+        # build time
+        from djangorecipe.templates import warm_up
+        warm_up(templates)
+    return application